@@ -1,11 +1,21 @@
 import asyncio
 import logging
+from contextlib import suppress
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.enums import ParseMode
 
-from config import BOT_TOKEN
+from config import (
+    BOT_TOKEN, INTERNAL_API_ENABLED, INTERNAL_API_PORT, WEBHOOK_MODE, WEBHOOK_PORT, DROP_PENDING_UPDATES
+)
 from handlers import user_router, admin_router, task_router
+from services.broadcaster import resume_broadcasts
+from services.internal_api import start_internal_server
+from services.offline import replayer
+from services.webhook import run_webhook, serves_internal_routes
+from utils.api import APIClient
+from utils.fsm_storage import create_storage
+from utils.resilience import DeadlineMiddleware
+from utils.roles import role_resolver
 from utils.logger import setup_logger
 
 logger = setup_logger(__name__)
@@ -23,16 +33,46 @@ class HTMLBot(Bot):
 
 async def main():
     bot = HTMLBot(token=BOT_TOKEN)
-    storage = MemoryStorage()
+    storage = create_storage()
     dp = Dispatcher(storage=storage)
+    dp.update.outer_middleware(DeadlineMiddleware())
 
     dp.include_router(user_router)
     dp.include_router(admin_router)
     dp.include_router(task_router)
 
     logger.info("Starting bot...")
-    await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
+    if not WEBHOOK_MODE:
+        await bot.delete_webhook(drop_pending_updates=DROP_PENDING_UPDATES)
+
+    resumed = await resume_broadcasts(bot)
+    if resumed:
+        logger.info(f"Resumed {resumed} unfinished broadcast(s)")
+
+    staff = await role_resolver.warm_up()
+    logger.info(f"Loaded {staff} staff role(s)")
+
+    internal_runner = None
+    if INTERNAL_API_ENABLED and WEBHOOK_MODE and INTERNAL_API_PORT == WEBHOOK_PORT:
+        # The webhook app holds the port and serves the internal routes itself
+        if not serves_internal_routes():
+            logger.warning("Internal API shares the webhook port but INTERNAL_API_TOKEN is not set; not serving it")
+    elif INTERNAL_API_ENABLED:
+        internal_runner = await start_internal_server()
+    replay_task = asyncio.create_task(replayer.run(bot))
+
+    try:
+        if WEBHOOK_MODE:
+            await run_webhook(dp, bot)
+        else:
+            await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+    finally:
+        replay_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await replay_task
+        if internal_runner:
+            await internal_runner.cleanup()
+        await APIClient.close()
 
 if __name__ == '__main__':
     try:
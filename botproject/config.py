@@ -1,4 +1,5 @@
 import os
+from urllib.parse import urlparse
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -8,18 +9,67 @@ if not BOT_TOKEN:
     raise ValueError("BOT_TOKEN environment variable is not set")
 
 API_URL = os.getenv("API_URL", "https://oltinsoy.onrender.com/api")
-API_BASE_URL = "https://oltinsoy.onrender.com/api/"
 API_TIMEOUT = int(os.getenv("API_TIMEOUT", "30"))
 API_RETRY_COUNT = int(os.getenv("API_RETRY_COUNT", "3"))
-API_RETRY_DELAY = int(os.getenv("API_RETRY_DELAY", "1"))
+API_RETRY_DELAY = float(os.getenv("API_RETRY_DELAY", "0.5"))
+API_RETRY_MAX_DELAY = float(os.getenv("API_RETRY_MAX_DELAY", "5"))
+API_BREAKER_THRESHOLD = int(os.getenv("API_BREAKER_THRESHOLD", "5"))
+API_BREAKER_RESET_TIMEOUT = float(os.getenv("API_BREAKER_RESET_TIMEOUT", "30"))
+API_UPDATE_DEADLINE = float(os.getenv("API_UPDATE_DEADLINE", "20"))
+API_UPLOAD_TIMEOUT = float(os.getenv("API_UPLOAD_TIMEOUT", "300"))
 API_POOL_SIZE = int(os.getenv("API_POOL_SIZE", "100"))
+API_POOL_PER_HOST = int(os.getenv("API_POOL_PER_HOST", "50"))
+API_KEEPALIVE_TIMEOUT = int(os.getenv("API_KEEPALIVE_TIMEOUT", "60"))
+
+TELEGRAM_DOWNLOAD_CONCURRENCY = int(os.getenv("TELEGRAM_DOWNLOAD_CONCURRENCY", "4"))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(64 * 1024)))
+
+TASK_LIST_PAGE_SIZE = int(os.getenv("TASK_LIST_PAGE_SIZE", "10"))
+MEDIA_GROUP_DELAY = float(os.getenv("MEDIA_GROUP_DELAY", "0.6"))
+
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "20"))
+BROADCAST_PER_CHAT_INTERVAL = float(os.getenv("BROADCAST_PER_CHAT_INTERVAL", "1"))
+BROADCAST_MAX_RETRIES = int(os.getenv("BROADCAST_MAX_RETRIES", "3"))
+BROADCAST_REPORT_BATCH = int(os.getenv("BROADCAST_REPORT_BATCH", "200"))
+BROADCAST_REPORT_INTERVAL = float(os.getenv("BROADCAST_REPORT_INTERVAL", "5"))
+BROADCAST_RESUME_ATTEMPTS = int(os.getenv("BROADCAST_RESUME_ATTEMPTS", "5"))
+BROADCAST_RESUME_DELAY = float(os.getenv("BROADCAST_RESUME_DELAY", "30"))
+OUTBOX_DB_PATH = os.getenv("OUTBOX_DB_PATH", "data/outbox.sqlite3")
+
+OFFLINE_DB_PATH = os.getenv("OFFLINE_DB_PATH", "data/offline.sqlite3")
+OFFLINE_REPLAY_INTERVAL = float(os.getenv("OFFLINE_REPLAY_INTERVAL", "15"))
 
 CACHE_TTL = int(os.getenv("CACHE_TTL", "300"))
 CACHE_MAX_SIZE = int(os.getenv("CACHE_MAX_SIZE", "1000"))
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()
+CACHE_L1_TTL = int(os.getenv("CACHE_L1_TTL", "10"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_CACHE_PREFIX = os.getenv("REDIS_CACHE_PREFIX", "oltinsoy:bot:")
 
 WEBHOOK_MODE = os.getenv("WEBHOOK_MODE", "False").lower() in ("true", "1", "t")
 WEBHOOK_URL = os.getenv("WEBHOOK_URL")
 WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH") or urlparse(WEBHOOK_URL or "").path or "/telegram/webhook"
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", "100"))
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "25"))
+DROP_PENDING_UPDATES = os.getenv("DROP_PENDING_UPDATES", "False").lower() in ("true", "1", "t")
+
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sqlite").lower()
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", str(7 * 24 * 60 * 60)))
+FSM_DB_PATH = os.getenv("FSM_DB_PATH", "data/fsm.sqlite3")
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "1"))
+FSM_REDIS_PREFIX = os.getenv("FSM_REDIS_PREFIX", "oltinsoy:fsm")
+
+ROLE_CACHE_TTL = int(os.getenv("ROLE_CACHE_TTL", "300"))
+
+INTERNAL_API_ENABLED = os.getenv("INTERNAL_API_ENABLED", "False").lower() in ("true", "1", "t")
+INTERNAL_API_HOST = os.getenv("INTERNAL_API_HOST", "0.0.0.0")
+INTERNAL_API_PORT = int(os.getenv("INTERNAL_API_PORT", "8080"))
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN")
 
 ADMIN_IDS = [int(id.strip()) for id in os.getenv("ADMIN_IDS", "").split(",") if id.strip()]
 
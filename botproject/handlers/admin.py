@@ -3,8 +3,8 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.enums import ParseMode
-from config import ADMIN_IDS
 from utils.logger import setup_logger
+from utils.roles import role_resolver
 from contextlib import suppress
 from keyboards.admin import (
     get_admin_menu, get_back_to_admin_menu, get_statistics_period_keyboard, 
@@ -21,14 +21,14 @@ from utils.api import (
     get_statistics, get_task_detail, grade_task, send_broadcast,
     get_districts, get_mahallas
 )
-from utils.bot import get_bot
+from services.broadcaster import schedule_broadcast
 from aiogram.types import FSInputFile
 
 logger = setup_logger(__name__)
 router = Router()
 
-def is_admin_filter(message: Message):
-    return message.from_user.id in ADMIN_IDS
+async def is_admin_filter(message: Message):
+    return await role_resolver.is_admin(message.from_user.id)
 
 @router.message(Command("admin"), is_admin_filter)
 async def cmd_admin(message: Message):
@@ -593,32 +593,19 @@ async def process_broadcast_confirmation(callback: CallbackQuery, state: FSMCont
                 await processing_msg.delete()
                 
             if response.success:
-                telegram_ids = response.data.get('telegram_ids', [])
-                sent_count = len(telegram_ids)
-                
-                # Send messages to users
-                bot = await get_bot()
-                success_count = 0
-                
-                for user_id in telegram_ids:
-                    try:
-                        await bot.send_message(
-                            user_id,
-                            f"📢 <b>{title}</b>\n\n{msg_text}",
-                            parse_mode=ParseMode.HTML
-                        )
-                        success_count += 1
-                    except Exception as e:
-                        logger.error(f"Failed to send message to user {user_id}: {e}")
-                    
-                    await asyncio.sleep(0.05)
-                
                 await callback.message.answer(
-                    f"✅ Xabar muvaffaqiyatli yuborildi!\n\n"
-                    f"Yuborilgan foydalanuvchilar soni: {success_count}/{sent_count}",
+                    f"⌛ Xabar {response.data.get('sent_count', 0)} ta foydalanuvchiga navbat bilan yuborilmoqda. "
+                    f"Yakunlangach natija shu yerga yuboriladi.",
                     reply_markup=get_admin_menu(),
                     parse_mode=ParseMode.HTML
                 )
+
+                schedule_broadcast(
+                    callback.bot,
+                    response.data.get('broadcast_id'),
+                    f"📢 <b>{title}</b>\n\n{msg_text}",
+                    admin_chat_id=callback.message.chat.id
+                )
             else:
                 error_message = response.message or "Xatolik yuz berdi"
                 await callback.message.answer(
@@ -2,8 +2,12 @@ from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.types import FSInputFile
-from utils.api import get_task_detail, update_task_status, submit_task_progress, get_task_stats, get_user_info
+from utils.api import get_task_detail, get_task_stats
+from services.offline import update_task_status, submit_task_progress
 from utils.logger import setup_logger
+from services.task_files import send_task_files
+from utils.task import notify_admins_about_completed_task
+from utils.fsm import append_files, media_groups
 from keyboards.inline import get_task_detail_keyboard, get_confirm_keyboard
 from keyboards.reply import get_main_menu, get_cancel_keyboard
 from states.user import TaskState
@@ -76,38 +80,7 @@ async def show_task_detail(message: Message, task_id: int):
             files = task.get('files', [])
             if files:
                 await message.answer(f"📎 <b>Topshiriq fayllari ({len(files)}):</b>")
-                
-                for file in files:
-                    file_url = file.get('url')
-                    file_name = file.get('name')
-                    
-                    if file_url:
-                        try:
-                            temp_dir = tempfile.mkdtemp()
-                            temp_file_path = os.path.join(temp_dir, file_name)
-                            
-                            async with aiohttp.ClientSession() as session:
-                                async with session.get(file_url) as resp:
-                                    if resp.status == 200:
-                                        with open(temp_file_path, 'wb') as fd:
-                                            while True:
-                                                chunk = await resp.content.read(1024)
-                                                if not chunk:
-                                                    break
-                                                fd.write(chunk)
-                                        
-                                        await message.answer_document(
-                                            FSInputFile(temp_file_path, filename=file_name),
-                                            caption=f"📎 {file_name}"
-                                        )
-                                        
-                                        os.remove(temp_file_path)
-                                        os.rmdir(temp_dir)
-                                    else:
-                                        await message.answer(f"❌ Faylni yuklab bo'lmadi: {file_name}")
-                        except Exception as e:
-                            logger.error(f"Error downloading file {file_name}: {e}")
-                            await message.answer(f"❌ Faylni yuklab bo'lmadi: {file_name}")
+                await send_task_files(message, task_id, files)
         else:
             await message.answer(
                 "Topshiriq ma'lumotlarini yuklashda xatolik yuz berdi. Iltimos, qaytadan urinib ko'ring."
@@ -163,7 +136,13 @@ async def complete_task(callback: CallbackQuery, state: FSMContext):
             await processing_msg.delete()
             await callback.message.delete()
 
-        if response.success:
+        if response.queued:
+            await callback.message.answer(
+                "⏳ Server vaqtincha ishlamayapti. Topshiriq holati saqlandi va server ishga tushgach yuboriladi.",
+                reply_markup=get_main_menu(),
+                parse_mode="HTML"
+            )
+        elif response.success:
             await callback.message.answer(
                 "✅ Topshiriq muvaffaqiyatli bajarildi!",
                 reply_markup=get_main_menu(),
@@ -190,55 +169,6 @@ async def complete_task(callback: CallbackQuery, state: FSMContext):
             parse_mode="HTML"
         )
 
-async def notify_admins_about_completed_task(task_id: int, user_id: int):
-    try:
-        from utils.api import get_task_detail, get_user_info
-        from config import ADMIN_IDS
-        from utils.bot import get_bot
-        from keyboards.admin import get_task_grading_keyboard
-        from utils.logger import setup_logger
-        
-        logger = setup_logger(__name__)
-        
-        task_response = await get_task_detail(task_id)
-        user_response = await get_user_info(user_id)
-        
-        if not task_response.success or not user_response.success:
-            logger.error("Failed to get task or user details for admin notification")
-            return
-            
-        task = task_response.data.get('task', {})
-        user = user_response.data.get('user', {})
-        
-        notification = (
-            f"🔔 <b>Yangi bajarilgan topshiriq!</b>\n\n"
-            f"🔹 <b>Topshiriq:</b> {task.get('title')}\n"
-            f"👤 <b>Foydalanuvchi:</b> {user.get('full_name')}\n"
-            f"🏙️ <b>Mahalla:</b> {user.get('mahalla_name')}\n"
-            f"📅 <b>Bajarilgan vaqt:</b> {task.get('completed_at')}\n\n"
-            f"Ushbu topshiriqni baholash uchun quyidagi tugmani bosing:"
-        )
-        
-        keyboard = get_task_grading_keyboard(task_id)
-        
-        bot = await get_bot()
-        
-        for admin_id in ADMIN_IDS:
-            try:
-                await bot.send_message(
-                    admin_id,
-                    notification,
-                    reply_markup=keyboard,
-                    parse_mode="HTML"
-                )
-            except Exception as e:
-                logger.error(f"Failed to send notification to admin {admin_id}: {e}")
-                
-    except Exception as e:
-        logger.error(f"Error in notify_admins_about_completed_task: {e}")
-
-    
-
 async def start_submit_report(callback: CallbackQuery, task_id: int, state: FSMContext):
     await callback.answer()
 
@@ -299,7 +229,13 @@ async def submit_report(message: Message, state: FSMContext):
         with suppress(Exception):
             await processing_msg.delete()
 
-        if response.success:
+        if response.queued:
+            await message.answer(
+                "⏳ Server vaqtincha ishlamayapti. Hisobot saqlandi va server ishga tushgach yuboriladi.",
+                reply_markup=get_main_menu(),
+                parse_mode="HTML"
+            )
+        elif response.success:
             await message.answer(
                 "✅ Hisobot muvaffaqiyatli yuborildi!",
                 reply_markup=get_main_menu(),
@@ -324,25 +260,34 @@ async def submit_report(message: Message, state: FSMContext):
             parse_mode="HTML"
         )
 
+def report_file_id(message: Message):
+    if message.photo:
+        return message.photo[-1].file_id
+    if message.document:
+        return message.document.file_id
+    if message.video:
+        return message.video.file_id
+    return None
+
 @router.message(F.photo | F.document | F.video, TaskState.report_files)
 async def process_report_file(message: Message, state: FSMContext):
     try:
-        file_id = None
-        if message.photo:
-            file_id = message.photo[-1].file_id
-        elif message.document:
-            file_id = message.document.file_id
-        elif message.video:
-            file_id = message.video.file_id
-
-        if file_id:
-            data = await state.get_data()
-            files = data.get('files', [])
-            files.append({'file_id': file_id})
-            await state.update_data(files=files)
+        if message.media_group_id:
+            # An album arrives as one update per item; the first handler gets them all
+            messages = await media_groups.collect(message)
+            if messages is None:
+                return
+        else:
+            messages = [message]
+
+        file_ids = [file_id for file_id in map(report_file_id, messages) if file_id]
+
+        if file_ids:
+            total = await append_files(state, [{'file_id': file_id} for file_id in file_ids])
+            added = "Fayl qo'shildi" if len(file_ids) == 1 else f"{len(file_ids)} ta fayl qo'shildi"
 
             await message.answer(
-                f"✅ Fayl qo'shildi. Jami fayllar soni: {len(files)}.\n"
+                f"✅ {added}. Jami fayllar soni: {total}.\n"
                 f"Yana fayl qo'shish uchun faylni yuboring yoki \"✅ Yuborish\" tugmasini bosing.",
                 reply_markup=get_cancel_keyboard(with_submit=True),
                 parse_mode="HTML"
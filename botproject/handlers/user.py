@@ -9,17 +9,18 @@ from keyboards.inline import (
     get_task_submission_keyboard, get_back_to_tasks_keyboard,
     get_confirm_keyboard, get_task_list_keyboard
 )
-from utils.api import (
-    get_user_info, verify_user, get_user_tasks, get_tasks, 
-    get_task_detail, update_task_status, submit_task_progress
-)
+from utils.api import APIError, verify_user, get_task_detail
 from utils.logger import setup_logger
-import asyncio
+from services.task_files import send_task_files
+from utils.resilience import api_deadline
+from utils.fsm import append_files, media_groups
+from services.offline import (
+    get_user_info, get_user_tasks, get_tasks, update_task_status, submit_task_progress, stale_notice
+)
 from contextlib import suppress
 import os
-import tempfile
-import aiohttp
-from config import MEDIA_ROOT
+from typing import Optional
+from config import MEDIA_ROOT, TASK_LIST_PAGE_SIZE
 
 logger = setup_logger(__name__)
 router = Router()
@@ -29,7 +30,8 @@ async def cmd_start(message: Message, state: FSMContext):
     processing_msg = await message.answer("⌛ Tekshirilmoqda...", parse_mode="HTML")
 
     try:
-        async with asyncio.timeout(5):
+        # A deadline rather than asyncio.timeout: an API timeout falls back to the offline snapshot
+        with api_deadline(5):
             response = await get_user_info(message.from_user.id)
 
             if response.success:
@@ -39,6 +41,7 @@ async def cmd_start(message: Message, state: FSMContext):
                     f"Lavozim: {user.get('job_title_name', 'Mavjud emas')}\n"
                     f"Mahalla: {user.get('mahalla_name', 'Mavjud emas')}\n"
                     f"Tuman: {user.get('tuman_name', 'Mavjud emas')}"
+                    f"{stale_notice(response)}"
                 )
 
                 with suppress(Exception):
@@ -57,7 +60,7 @@ async def cmd_start(message: Message, state: FSMContext):
                 )
                 logger.info(f"User {message.from_user.id} started registration")
 
-    except asyncio.TimeoutError:
+    except APIError:
         with suppress(Exception):
             await processing_msg.delete()
         await message.answer(
@@ -99,6 +102,9 @@ async def show_tasks(message: Message):
             completed_tasks = [t for t in tasks if t.get('status') == 'completed']
             rejected_tasks = [t for t in tasks if t.get('status') == 'rejected']
 
+            if response.stale:
+                await message.answer(stale_notice(response).strip(), parse_mode="HTML")
+
             if active_tasks:
                 await message.answer("📋 <b>Faol topshiriqlar:</b>", parse_mode="HTML")
                 for task in active_tasks:
@@ -202,7 +208,7 @@ async def show_stats(message: Message):
                     stats_text += f"• {task.get('updated_at', 'N/A')}: {task.get('title')} - {status_text}\n"
 
             await message.answer(
-                stats_text,
+                stats_text + stale_notice(response),
                 reply_markup=get_main_menu(),
                 parse_mode="HTML"
             )
@@ -349,12 +355,25 @@ async def process_jshir(message: Message, state: FSMContext):
 
 @router.message(Command("tasks"))
 async def cmd_tasks(message: Message):
-    user_id = message.from_user.id
-    
+    await send_task_list(message, message.from_user.id)
+
+@router.callback_query(F.data.startswith("tasks_page_"))
+async def process_tasks_page(callback: CallbackQuery):
+    await callback.answer()
+    try:
+        cursor = int(callback.data.split("_")[2])
+    except (ValueError, IndexError) as e:
+        logger.error(f"Error parsing tasks_page callback data: {e}")
+        await callback.message.answer("Xatolik yuz berdi. Iltimos, qaytadan urinib ko'ring.", parse_mode="HTML")
+        return
+
+    await send_task_list(callback.message, callback.from_user.id, cursor=cursor)
+
+async def send_task_list(message: Message, user_id: int, cursor: Optional[int] = None):
     processing_msg = await message.answer("⌛ Topshiriqlar yuklanmoqda...", parse_mode="HTML")
     
     try:
-        response = await get_tasks(user_id=user_id)
+        response = await get_tasks(user_id=user_id, cursor=cursor, limit=TASK_LIST_PAGE_SIZE)
         
         with suppress(Exception):
             await processing_msg.delete()
@@ -367,14 +386,15 @@ async def cmd_tasks(message: Message):
                 return
                 
             await message.answer(
-                "📋 <b>Topshiriqlar ro'yxati</b>\n\nBatafsil ma'lumot olish uchun topshiriqni tanlang:",
-                reply_markup=get_task_list_keyboard(tasks),
+                "📋 <b>Topshiriqlar ro'yxati</b>\n\nBatafsil ma'lumot olish uchun topshiriqni tanlang:"
+                f"{stale_notice(response)}",
+                reply_markup=get_task_list_keyboard(tasks, response.data.get('next_cursor')),
                 parse_mode="HTML"
             )
         else:
             await message.answer("Topshiriqlarni yuklashda xatolik yuz berdi. Iltimos, qaytadan urinib ko'ring.", parse_mode="HTML")
     except Exception as e:
-        logger.error(f"Error in cmd_tasks: {e}")
+        logger.error(f"Error in send_task_list: {e}")
         with suppress(Exception):
             await processing_msg.delete()
         await message.answer("Xatolik yuz berdi. Iltimos, qaytadan urinib ko'ring.", parse_mode="HTML")
@@ -400,10 +420,7 @@ async def process_task_complete(callback: CallbackQuery):
         # Show processing message
         processing_msg = await callback.message.answer("⌛ Topshiriq bajarilmoqda...", parse_mode="HTML")
         
-        # Import the update_task_status function
-        from utils.api import update_task_status
-        
-        # Call the API to update task status
+        # Call the API to update task status (queued if the API is down)
         response = await update_task_status(
             task_id=task_id,
             status="completed",
@@ -414,7 +431,13 @@ async def process_task_complete(callback: CallbackQuery):
         with suppress(Exception):
             await processing_msg.delete()
         
-        if response.success:
+        if response.queued:
+            await callback.message.answer(
+                "⏳ Server vaqtincha ishlamayapti. Topshiriq holati saqlandi va server ishga tushgach yuboriladi.",
+                reply_markup=get_main_menu(),
+                parse_mode="HTML"
+            )
+        elif response.success:
             await callback.message.answer(
                 "✅ Topshiriq muvaffaqiyatli bajarildi!",
                 reply_markup=get_main_menu(),
@@ -521,40 +544,10 @@ async def show_task_detail(message: Message, task_id: int):
               parse_mode="HTML"
           )
 
-          # Handle files safely through API
           files = task.get('files', [])
           if files:
               await message.answer(f"📎 <b>Topshiriq fayllari ({len(files)}):</b>", parse_mode="HTML")
-              
-              for file in files:
-                  file_url = file.get('url')
-                  file_name = file.get('name')
-                  
-                  if file_url:
-                      try:
-                          # Download file from API URL
-                          async with aiohttp.ClientSession() as session:
-                              async with session.get(file_url) as resp:
-                                  if resp.status == 200:
-                                      file_content = await resp.read()
-                                      
-                                      # Create a BytesIO object to send as document
-                                      from io import BytesIO
-                                      file_obj = BytesIO(file_content)
-                                      
-                                      # Send as document
-                                      await message.answer_document(
-                                          types.BufferedInputFile(
-                                              file_obj.getvalue(),
-                                              filename=file_name
-                                          ),
-                                          caption=f"📎 {file_name}"
-                                      )
-                                  else:
-                                      await message.answer(f"❌ Faylni yuklab bo'lmadi: {file_name}", parse_mode="HTML")
-                      except Exception as e:
-                          logger.error(f"Error downloading file {file_name}: {e}")
-                          await message.answer(f"❌ Faylni yuklab bo'lmadi: {file_name}", parse_mode="HTML")
+              await send_task_files(message, task_id, files)
       else:
           await message.answer(
               "Topshiriq ma'lumotlarini yuklashda xatolik yuz berdi. Iltimos, qaytadan urinib ko'ring.",
@@ -572,7 +565,7 @@ async def show_task_detail(message: Message, task_id: int):
 @router.callback_query(F.data == "back_to_tasks")
 async def back_to_tasks_list(callback: CallbackQuery):
     await callback.answer()
-    await cmd_tasks(callback.message)
+    await send_task_list(callback.message, callback.from_user.id)
 
 @router.callback_query(F.data.startswith("submit_task_"))
 async def start_task_submission(callback: CallbackQuery, state: FSMContext):
@@ -614,21 +607,23 @@ async def process_task_comment(message: Message, state: FSMContext):
 
 @router.message(TaskSubmissionState.files, F.document)
 async def process_task_files(message: Message, state: FSMContext):
-    data = await state.get_data()
-    files = data.get('files', [])
-    
-    document = message.document
-    file_id = document.file_id
-    file_name = document.file_name
-    
-    files.append({
-        'file_id': file_id,
-        'file_name': file_name
-    })
-    
-    await state.update_data(files=files)
+    if message.media_group_id:
+        # An album arrives as one update per document; the first handler gets them all
+        messages = await media_groups.collect(message)
+        if messages is None:
+            return
+    else:
+        messages = [message]
+
+    files = [
+        {'file_id': item.document.file_id, 'file_name': item.document.file_name}
+        for item in messages if item.document
+    ]
+    await append_files(state, files)
+
+    file_names = ", ".join(file['file_name'] or "fayl" for file in files)
     await message.answer(
-        f"✅ Fayl qabul qilindi: {file_name}\n\nYana fayl yuklash mumkin yoki \"✅ Yuborishni yakunlash\" tugmasini bosing.",
+        f"✅ Fayl qabul qilindi: {file_names}\n\nYana fayl yuklash mumkin yoki \"✅ Yuborishni yakunlash\" tugmasini bosing.",
         parse_mode="HTML"
     )
 
@@ -653,7 +648,15 @@ async def finish_task_submission(message: Message, state: FSMContext):
         with suppress(Exception):
             await processing_msg.delete()
             
-        if response.success:
+        if response.queued:
+            await message.answer(
+                "⏳ <b>Server vaqtincha ishlamayapti.</b>\n\n"
+                "Topshiriq saqlandi va server ishga tushgach avtomatik yuboriladi.\n"
+                f"Yuklangan fayllar soni: {len(files)}",
+                reply_markup=get_main_menu(),
+                parse_mode="HTML"
+            )
+        elif response.success:
             await message.answer(
                 "✅ <b>Topshiriq muvaffaqiyatli yuborildi!</b>\n\n"
                 f"Izoh: {comment}\n"
@@ -42,7 +42,7 @@ def get_confirm_keyboard() -> InlineKeyboardMarkup:
 
     return builder.as_markup()
 
-def get_task_list_keyboard(tasks: list) -> InlineKeyboardMarkup:
+def get_task_list_keyboard(tasks: list, next_cursor: int = None) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     
     for task in tasks:
@@ -53,6 +53,11 @@ def get_task_list_keyboard(tasks: list) -> InlineKeyboardMarkup:
                 callback_data=f"task_{task['id']}"
             )
         )
+
+    if next_cursor:
+        builder.row(
+            InlineKeyboardButton(text="➡️ Keyingi", callback_data=f"tasks_page_{next_cursor}")
+        )
     
     return builder.as_markup()
 
@@ -1,26 +1,301 @@
+import asyncio
+import random
+import time
+from contextlib import suppress
+from dataclasses import dataclass, field
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Union
+
 from aiogram import Bot
-from database import SessionLocal
-from models.base import User
+from aiogram.enums import ParseMode
+from aiogram.exceptions import (
+    TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError,
+    TelegramRetryAfter, TelegramServerError
+)
+
+from config import (
+    BROADCAST_RATE, BROADCAST_WORKERS, BROADCAST_PER_CHAT_INTERVAL, BROADCAST_MAX_RETRIES,
+    BROADCAST_RESUME_ATTEMPTS, BROADCAST_RESUME_DELAY
+)
+from services.outbox import outbox, DeliveryRecorder
+from utils.api import APIError, get_broadcast_recipients
 from utils.logger import setup_logger
+from utils.resilience import api_deadline
 
 logger = setup_logger(__name__)
 
-async def broadcast_message(bot: Bot, message: str) -> tuple[int, int]:
-    successful, failed = 0, 0
-    db = SessionLocal()
-    
-    try:
-        users = db.query(User).all()
-        for user in users:
+
+class TokenBucket:
+    """Async token bucket: refills `rate` tokens per second up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """Stop handing out tokens for `seconds`, e.g. after a flood-control error."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ChatLimiter:
+    """Keeps sends to the same chat at least `interval` seconds apart."""
+
+    max_tracked = 10000
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.next_allowed = {}
+
+    async def wait(self, chat_id: int):
+        now = time.monotonic()
+        if len(self.next_allowed) >= self.max_tracked:
+            self.next_allowed = {k: v for k, v in self.next_allowed.items() if v > now}
+
+        allowed_at = self.next_allowed.get(chat_id, 0.0)
+        self.next_allowed[chat_id] = max(now, allowed_at) + self.interval
+
+        if allowed_at > now:
+            await asyncio.sleep(allowed_at - now)
+
+
+@dataclass
+class BroadcastResult:
+    total: int = 0
+    delivered: int = 0
+    failed: int = 0
+    blocked: List[int] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def rate(self) -> float:
+        return self.delivered / self.elapsed if self.elapsed else 0.0
+
+
+class Broadcaster:
+    """
+    Sends one message to many chats through a bounded pool of workers.
+
+    Every send takes a token from a global bucket (Telegram allows about 30 messages
+    per second per bot) and respects a minimum interval per chat. RetryAfter pauses
+    the whole bucket and the message is retried; users who blocked the bot are
+    reported in `blocked` and never retried.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        rate: float = BROADCAST_RATE,
+        workers: int = BROADCAST_WORKERS,
+        per_chat_interval: float = BROADCAST_PER_CHAT_INTERVAL,
+        max_retries: int = BROADCAST_MAX_RETRIES
+    ):
+        self.bot = bot
+        self.bucket = TokenBucket(rate)
+        self.chat_limiter = ChatLimiter(per_chat_interval)
+        self.workers = workers
+        self.max_retries = max_retries
+
+    async def send(
+        self,
+        recipients: Union[Iterable[int], AsyncIterable[int]],
+        text: str,
+        on_result: Optional[Callable[[int, str], Awaitable[None]]] = None,
+        **kwargs
+    ) -> BroadcastResult:
+        kwargs.setdefault('parse_mode', ParseMode.HTML)
+        result = BroadcastResult()
+        queue = asyncio.Queue(maxsize=self.workers * 2)
+        started_at = time.monotonic()
+
+        async def produce():
+            if hasattr(recipients, '__aiter__'):
+                async for chat_id in recipients:
+                    await queue.put(chat_id)
+            else:
+                for chat_id in recipients:
+                    await queue.put(chat_id)
+
+        async def consume():
+            while True:
+                chat_id = await queue.get()
+                try:
+                    result.total += 1
+                    status = await self.deliver(chat_id, text, **kwargs)
+                    if status == 'delivered':
+                        result.delivered += 1
+                    elif status == 'blocked':
+                        result.blocked.append(chat_id)
+                    else:
+                        result.failed += 1
+                    if on_result:
+                        await on_result(chat_id, status)
+                except Exception as e:
+                    # A worker that dies leaves its share of the queue unconsumed and join() waiting forever
+                    logger.error(f"Broadcast to {chat_id} failed: {e}")
+                finally:
+                    queue.task_done()
+
+        workers = [asyncio.create_task(consume()) for _ in range(self.workers)]
+        try:
+            await produce()
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        result.elapsed = time.monotonic() - started_at
+        logger.info(
+            f"Broadcast finished: {result.delivered}/{result.total} delivered, "
+            f"{len(result.blocked)} blocked, {result.failed} failed in {result.elapsed:.1f}s"
+        )
+        return result
+
+    async def deliver(self, chat_id: int, text: str, **kwargs) -> str:
+        """Send to a single chat; returns 'delivered', 'blocked' or 'failed'."""
+        attempt = 0
+        while True:
+            await self.bucket.acquire()
+            await self.chat_limiter.wait(chat_id)
+
             try:
-                await bot.send_message(user.telegram_id, message)
-                successful += 1
-                logger.info(f"Message sent to {user.telegram_id}")
+                await self.bot.send_message(chat_id, text, **kwargs)
+                return 'delivered'
+            except TelegramRetryAfter as e:
+                logger.warning(f"Flood control on {chat_id}, pausing for {e.retry_after}s")
+                self.bucket.pause(e.retry_after)
+                continue
+            except TelegramForbiddenError:
+                return 'blocked'
+            except TelegramBadRequest as e:
+                logger.error(f"Failed to send message to {chat_id}: {e}")
+                return 'failed'
+            except (TelegramNetworkError, TelegramServerError) as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    logger.error(f"Failed to send message to {chat_id} after {attempt} attempts: {e}")
+                    return 'failed'
+                await asyncio.sleep(min(2 ** attempt, 30) * random.uniform(0.5, 1.0))
             except Exception as e:
-                failed += 1
-                logger.error(f"Failed to send message to {user.telegram_id}: {e}")
-    finally:
-        db.close()
-    
-    return successful, failed
+                logger.error(f"Failed to send message to {chat_id}: {e}")
+                return 'failed'
+
+
+_broadcast_tasks = set()
+
+
+async def iter_recipients(broadcast_id: int) -> AsyncIterator[int]:
+    """
+    Yield a broadcast's recipients: first those already in the outbox but still pending,
+    then new pages from the API, each stored in the outbox before it is handed out.
+    """
+    async for telegram_id in outbox.iter_pending(broadcast_id):
+        yield telegram_id
+
+    cursor, fetched = await outbox.fetch_state(broadcast_id)
+    while not fetched:
+        response = await get_broadcast_recipients(broadcast_id, cursor)
+        if not response.success:
+            raise APIError(response.message or "Failed to fetch broadcast recipients", response.status_code)
+
+        telegram_ids = response.data.get('telegram_ids', [])
+        cursor = response.data.get('next_cursor')
+        fetched = cursor is None
+
+        await outbox.add_recipients(broadcast_id, telegram_ids, cursor)
+        for telegram_id in telegram_ids:
+            yield telegram_id
+
+
+async def run_broadcast(
+    bot: Bot,
+    broadcast_id: int,
+    text: str,
+    admin_chat_id: Optional[int] = None
+) -> Dict[str, int]:
+    """Deliver a broadcast through the outbox; calling it again resumes where it stopped."""
+    await outbox.create(broadcast_id, text, admin_chat_id)
+
+    recorder = DeliveryRecorder(outbox, broadcast_id)
+    try:
+        result = await Broadcaster(bot).send(iter_recipients(broadcast_id), text, on_result=recorder)
+    except BaseException:
+        # Shutting down, or a recipient page couldn't be fetched: keep what was already
+        # sent so the resume doesn't repeat it
+        with suppress(Exception):
+            await recorder.flush()
+        raise
+    counts = await recorder.flush()
+    await outbox.finish(broadcast_id)
+
+    if admin_chat_id:
+        total = sum(counts.values())
+        with suppress(Exception):
+            await bot.send_message(
+                admin_chat_id,
+                f"✅ Xabar yuborish yakunlandi!\n\n"
+                f"Yuborilgan foydalanuvchilar soni: {counts['delivered']}/{total}\n"
+                f"Botni bloklaganlar: {counts['blocked']}\n"
+                f"Xatoliklar: {counts['failed']}\n"
+                f"Vaqt: {result.elapsed:.0f} soniya",
+                parse_mode=ParseMode.HTML
+            )
+
+    return counts
+
+
+def schedule_broadcast(bot: Bot, broadcast_id: int, text: str, admin_chat_id: Optional[int] = None) -> asyncio.Task:
+    async def runner():
+        try:
+            # The task copies the caller's context; a broadcast must not inherit a handler's deadline
+            with api_deadline(None):
+                for attempt in range(1, BROADCAST_RESUME_ATTEMPTS + 1):
+                    try:
+                        await run_broadcast(bot, broadcast_id, text, admin_chat_id)
+                        return
+                    except APIError as e:
+                        # The API is down or a page failed; the outbox lets the next attempt resume
+                        if attempt == BROADCAST_RESUME_ATTEMPTS:
+                            raise
+                        logger.warning(f"Broadcast {broadcast_id} paused ({e.message}), resuming in {BROADCAST_RESUME_DELAY * attempt:.0f}s")
+                        await asyncio.sleep(BROADCAST_RESUME_DELAY * attempt)
+        except Exception as e:
+            logger.error(f"Broadcast {broadcast_id} stopped: {e}")
+            if admin_chat_id:
+                with suppress(Exception):
+                    await bot.send_message(admin_chat_id, "❌ Xabar yuborishda xatolik yuz berdi.")
+
+    task = asyncio.create_task(runner())
+    _broadcast_tasks.add(task)
+    task.add_done_callback(_broadcast_tasks.discard)
+    return task
+
 
+async def resume_broadcasts(bot: Bot) -> int:
+    """Restart every broadcast the outbox still has pending recipients for."""
+    unfinished = await outbox.unfinished()
+    for broadcast_id, text, admin_chat_id in unfinished:
+        logger.info(f"Resuming broadcast {broadcast_id}")
+        schedule_broadcast(bot, broadcast_id, text, admin_chat_id)
+    return len(unfinished)
@@ -0,0 +1,57 @@
+import hmac
+from functools import wraps
+
+from aiohttp import web
+
+from config import INTERNAL_API_HOST, INTERNAL_API_PORT, INTERNAL_API_TOKEN
+from utils.logger import setup_logger
+from utils.roles import role_resolver
+
+logger = setup_logger(__name__)
+
+
+def require_token(handler):
+    # Per route rather than app-wide: the Telegram webhook is served by the same app
+    @wraps(handler)
+    async def wrapper(request: web.Request) -> web.Response:
+        # Without a configured token nobody is trusted
+        token = request.headers.get('X-Internal-Token', '')
+        if not INTERNAL_API_TOKEN or not hmac.compare_digest(token, INTERNAL_API_TOKEN):
+            return web.json_response({'message': 'Forbidden'}, status=403)
+        return await handler(request)
+    return wrapper
+
+
+@require_token
+async def role_changed(request: web.Request) -> web.Response:
+    try:
+        data = await request.json()
+        telegram_id = int(data['telegram_id'])
+    except (ValueError, KeyError, TypeError):
+        return web.json_response({'message': 'telegram_id is required'}, status=400)
+
+    # The body only says whose role changed; the role itself is re-read from /user-info/
+    await role_resolver.invalidate(telegram_id)
+    logger.info(f"Role of {telegram_id} changed, cached role dropped")
+    return web.json_response({'success': True})
+
+
+def setup_internal_routes(app: web.Application):
+    """Routes the Django API calls on the bot (see TELEGRAM_BOT_WEBHOOK_URL)."""
+    app.router.add_post('/webhook/role-changed', role_changed)
+
+
+def create_internal_app() -> web.Application:
+    app = web.Application()
+    setup_internal_routes(app)
+    return app
+
+
+async def start_internal_server(host: str = INTERNAL_API_HOST, port: int = INTERNAL_API_PORT) -> web.AppRunner:
+    if not INTERNAL_API_TOKEN:
+        logger.warning("INTERNAL_API_TOKEN is not set, the internal API will refuse every request")
+    runner = web.AppRunner(create_internal_app())
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Internal API listening on {host}:{port}")
+    return runner
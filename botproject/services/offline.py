@@ -0,0 +1,363 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import suppress
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram import Bot
+
+from config import OFFLINE_DB_PATH, OFFLINE_REPLAY_INTERVAL
+from utils import api
+from utils.api import APIError, APIResponse
+from utils.logger import setup_logger
+from utils.resilience import api_deadline
+
+logger = setup_logger(__name__)
+
+# Statuses a sleeping or cold-starting backend answers with; anything else is a real answer
+UNAVAILABLE_STATUSES = frozenset({408, 502, 503, 504})
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    key TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    saved_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS pending_writes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    telegram_id INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pending_writes_telegram_id ON pending_writes (telegram_id, id);
+"""
+
+
+class OfflineStore:
+    """
+    Local SQLite copy of what the bot needs while the API is unreachable: the last
+    successful response for each snapshotted read, and the writes waiting to be sent.
+    sqlite3 is blocking, so every call runs in a thread behind a single lock.
+    """
+
+    max_digests = 10000
+
+    def __init__(self, path: str = OFFLINE_DB_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = asyncio.Lock()
+        self._digests: Dict[str, bytes] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    async def _run(self, func, *args):
+        async with self._lock:
+            return await asyncio.to_thread(func, *args)
+
+    def _save_snapshot(self, key, data):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO snapshots (key, data, saved_at) VALUES (?, ?, ?)",
+                (key, data, time.time())
+            )
+
+    async def save_snapshot(self, key: str, data: Dict[str, Any]):
+        """Store a response body; unchanged bodies (most reads are cache hits) are not rewritten."""
+        encoded = json.dumps(data, sort_keys=True, default=str)
+        digest = hashlib.md5(encoded.encode()).digest()
+        if self._digests.get(key) == digest:
+            return
+        if len(self._digests) >= self.max_digests:
+            self._digests.clear()
+
+        await self._run(self._save_snapshot, key, encoded)
+        self._digests[key] = digest
+
+    def _load_snapshot(self, key):
+        return self._connect().execute(
+            "SELECT data, saved_at FROM snapshots WHERE key = ?",
+            (key,)
+        ).fetchone()
+
+    async def load_snapshot(self, key: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        row = await self._run(self._load_snapshot, key)
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def _delete_snapshot(self, key):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM snapshots WHERE key = ?", (key,))
+
+    async def delete_snapshot(self, key: str):
+        self._digests.pop(key, None)
+        await self._run(self._delete_snapshot, key)
+
+    def _enqueue(self, kind, telegram_id, payload):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO pending_writes (kind, telegram_id, payload, created_at) VALUES (?, ?, ?, ?)",
+                (kind, telegram_id, json.dumps(payload), time.time())
+            )
+
+    async def enqueue(self, kind: str, telegram_id: int, payload: Dict[str, Any]):
+        await self._run(self._enqueue, kind, telegram_id, payload)
+
+    def _pending(self, after_id, limit):
+        return self._connect().execute(
+            "SELECT id, kind, telegram_id, payload FROM pending_writes WHERE id > ? ORDER BY id LIMIT ?",
+            (after_id, limit)
+        ).fetchall()
+
+    async def pending(self, after_id: int = 0, limit: int = 100) -> List[Tuple[int, str, int, Dict[str, Any]]]:
+        rows = await self._run(self._pending, after_id, limit)
+        return [(write_id, kind, telegram_id, json.loads(payload)) for write_id, kind, telegram_id, payload in rows]
+
+    def _has_pending(self, telegram_id):
+        return self._connect().execute(
+            "SELECT 1 FROM pending_writes WHERE telegram_id = ? LIMIT 1",
+            (telegram_id,)
+        ).fetchone() is not None
+
+    async def has_pending(self, telegram_id: int) -> bool:
+        return await self._run(self._has_pending, telegram_id)
+
+    def _remove(self, write_id):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM pending_writes WHERE id = ?", (write_id,))
+
+    async def remove(self, write_id: int):
+        await self._run(self._remove, write_id)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+store = OfflineStore()
+
+
+def is_unavailable(response: APIResponse) -> bool:
+    return response.status_code in UNAVAILABLE_STATUSES
+
+
+async def read_through(key: str, call: Callable[[], Awaitable[APIResponse]]) -> APIResponse:
+    """
+    Return the live response and keep it as the snapshot for `key`. If the API is
+    unreachable, return the snapshot instead with `stale` set; without one, the
+    original failure goes to the caller as before.
+    """
+    failure: Optional[APIError] = None
+    try:
+        response = await call()
+    except APIError as e:
+        if e.status_code not in UNAVAILABLE_STATUSES:
+            raise
+        failure, response = e, None
+    else:
+        if response.success:
+            await store.save_snapshot(key, response.data)
+            return response
+        if response.status_code == 404:
+            await store.delete_snapshot(key)
+        if not is_unavailable(response):
+            return response
+
+    snapshot = await store.load_snapshot(key)
+    if snapshot is None:
+        if failure is not None:
+            raise failure
+        return response
+
+    data, saved_at = snapshot
+    stale = APIResponse(data, 200)
+    stale.stale = True
+    stale.saved_at = saved_at
+    return stale
+
+
+def stale_notice(response: APIResponse) -> str:
+    """Footer for replies built from a snapshot; empty for live responses."""
+    if not response.stale:
+        return ""
+    saved_at = datetime.fromtimestamp(response.saved_at).strftime('%d.%m.%Y %H:%M')
+    return f"\n\n⚠️ <i>Server bilan aloqa yo'q. Ma'lumotlar {saved_at} holatiga ko'ra.</i>"
+
+
+async def get_user_info(telegram_id: int) -> APIResponse:
+    return await read_through(f"user:{telegram_id}", lambda: api.get_user_info(telegram_id))
+
+
+async def get_user_tasks(telegram_id: int) -> APIResponse:
+    return await read_through(f"user_tasks:{telegram_id}", lambda: api.get_user_tasks(telegram_id))
+
+
+async def get_tasks(user_id: int, cursor: Optional[int] = None, limit: Optional[int] = None) -> APIResponse:
+    return await read_through(
+        f"tasks:{user_id}:{cursor}:{limit}",
+        lambda: api.get_tasks(user_id=user_id, cursor=cursor, limit=limit)
+    )
+
+
+WRITERS: Dict[str, Callable[..., Awaitable[APIResponse]]] = {
+    'update_task_status': api.update_task_status,
+    'submit_task_progress': api.submit_task_progress,
+}
+
+
+async def write_through(kind: str, telegram_id: int, payload: Dict[str, Any]) -> APIResponse:
+    """
+    Send a write, or queue it if the API is unreachable. While a user has writes queued,
+    their new writes are queued behind them so the backend sees each user's writes in the
+    order they were made; other users' writes go straight to the API.
+
+    Every write carries an idempotency key, kept when it is queued. A timeout doesn't
+    mean the API didn't store the write, so a replay may repeat one it already has;
+    the key lets the API answer the repeat without storing it twice.
+    The returned response has `queued` set when the write was deferred.
+    """
+    payload = {**payload, 'idempotency_key': uuid.uuid4().hex}
+    if not await store.has_pending(telegram_id):
+        try:
+            response = await WRITERS[kind](**payload)
+            if not is_unavailable(response):
+                return response
+        except APIError as e:
+            if e.status_code not in UNAVAILABLE_STATUSES:
+                raise
+
+    await store.enqueue(kind, telegram_id, payload)
+    replayer.wake()
+    logger.info(f"API unavailable, queued {kind} for {telegram_id}")
+
+    queued = APIResponse({'message': "Server vaqtincha ishlamayapti, so'rov navbatga qo'yildi"}, 202)
+    queued.queued = True
+    return queued
+
+
+async def update_task_status(
+    task_id: int,
+    status: str,
+    telegram_id: int,
+    rejection_reason: Optional[str] = None
+) -> APIResponse:
+    return await write_through('update_task_status', telegram_id, {
+        'task_id': task_id,
+        'status': status,
+        'telegram_id': telegram_id,
+        'rejection_reason': rejection_reason,
+    })
+
+
+async def submit_task_progress(
+    task_id: int,
+    telegram_id: int,
+    description: str,
+    files: Optional[List[Dict[str, str]]] = None
+) -> APIResponse:
+    # Telegram file_ids stay valid, so files are downloaded again at replay time
+    return await write_through('submit_task_progress', telegram_id, {
+        'task_id': task_id,
+        'telegram_id': telegram_id,
+        'description': description,
+        'files': files,
+    })
+
+
+class WriteReplayer:
+    """
+    Sends queued writes oldest first. When the API still can't take a user's write, the
+    rest of that user's writes wait for the next round so nothing overtakes it, while
+    other users' writes carry on. Writes the API rejects are dropped and the user is
+    told. Runs every `interval` seconds and whenever a write is queued.
+    """
+
+    def __init__(self, offline_store: OfflineStore, interval: float = OFFLINE_REPLAY_INTERVAL):
+        self.store = offline_store
+        self.interval = interval
+        self.bot: Optional[Bot] = None
+        self._wakeup = asyncio.Event()
+
+    def wake(self):
+        self._wakeup.set()
+
+    async def replay(self) -> int:
+        sent = 0
+        blocked = set()
+        last_id = 0
+        while True:
+            writes = await self.store.pending(last_id)
+            if not writes:
+                return sent
+
+            for write_id, kind, telegram_id, payload in writes:
+                last_id = write_id
+                if telegram_id in blocked:
+                    continue
+
+                try:
+                    response = await WRITERS[kind](**payload)
+                except APIError as e:
+                    if e.status_code in UNAVAILABLE_STATUSES:
+                        blocked.add(telegram_id)
+                        continue
+                    response = APIResponse({}, e.status_code, e.message)
+
+                if is_unavailable(response):
+                    blocked.add(telegram_id)
+                    continue
+
+                await self.store.remove(write_id)
+                sent += 1
+                await self.report(kind, telegram_id, payload, response)
+
+    async def report(self, kind: str, telegram_id: int, payload: Dict[str, Any], response: APIResponse):
+        if response.success:
+            logger.info(f"Replayed {kind} for {telegram_id}")
+            text = "✅ Navbatdagi so'rovingiz serverga yuborildi."
+        else:
+            logger.error(f"Replayed {kind} for {telegram_id} was rejected: {response.message}")
+            text = f"❌ Navbatdagi so'rovingiz qabul qilinmadi: {response.message or 'Xatolik yuz berdi'}"
+
+        if self.bot:
+            with suppress(Exception):
+                await self.bot.send_message(telegram_id, text, parse_mode="HTML")
+
+        if response.success and kind == 'update_task_status' and payload['status'] == 'completed':
+            from utils.task import notify_admins_about_completed_task
+            await notify_admins_about_completed_task(payload['task_id'], telegram_id)
+
+    async def run(self, bot: Optional[Bot] = None):
+        self.bot = bot
+        with api_deadline(None):
+            while True:
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), self.interval)
+                self._wakeup.clear()
+                try:
+                    await self.replay()
+                except Exception as e:
+                    logger.error(f"Replaying queued writes failed: {e}")
+
+
+replayer = WriteReplayer(store)
@@ -0,0 +1,215 @@
+import asyncio
+import os
+import sqlite3
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from config import OUTBOX_DB_PATH, BROADCAST_REPORT_BATCH, BROADCAST_REPORT_INTERVAL
+from utils.api import update_broadcast_status
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id INTEGER PRIMARY KEY,
+    text TEXT NOT NULL,
+    admin_chat_id INTEGER,
+    cursor INTEGER,
+    fetched INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    finished_at TEXT
+);
+CREATE TABLE IF NOT EXISTS recipients (
+    broadcast_id INTEGER NOT NULL,
+    telegram_id INTEGER NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (broadcast_id, telegram_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS recipients_state ON recipients (broadcast_id, state, telegram_id);
+"""
+
+
+class BroadcastOutbox:
+    """
+    Durable record of every broadcast recipient and its delivery state.
+
+    Recipients are appended page by page as they are fetched from the API, together
+    with the cursor of the next page. Rows start as 'pending' and move to 'delivered',
+    'blocked' or 'failed' as results are flushed, so a restarted bot only resends to
+    recipients that are still pending and continues fetching from the saved cursor.
+    sqlite3 is blocking, so every call runs in a thread behind a single lock.
+    """
+
+    def __init__(self, path: str = OUTBOX_DB_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = asyncio.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    async def _run(self, func, *args):
+        async with self._lock:
+            return await asyncio.to_thread(func, *args)
+
+    def _create(self, broadcast_id, text, admin_chat_id):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO broadcasts (id, text, admin_chat_id) VALUES (?, ?, ?)",
+                (broadcast_id, text, admin_chat_id)
+            )
+
+    async def create(self, broadcast_id: int, text: str, admin_chat_id: Optional[int]):
+        await self._run(self._create, broadcast_id, text, admin_chat_id)
+
+    def _add_recipients(self, broadcast_id, telegram_ids, next_cursor):
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO recipients (broadcast_id, telegram_id) VALUES (?, ?)",
+                ((broadcast_id, telegram_id) for telegram_id in telegram_ids)
+            )
+            conn.execute(
+                "UPDATE broadcasts SET cursor = ?, fetched = ? WHERE id = ?",
+                (next_cursor, next_cursor is None, broadcast_id)
+            )
+
+    async def add_recipients(self, broadcast_id: int, telegram_ids: List[int], next_cursor: Optional[int]):
+        """Store one fetched page; next_cursor=None marks the recipient list as complete."""
+        await self._run(self._add_recipients, broadcast_id, telegram_ids, next_cursor)
+
+    def _fetch_state(self, broadcast_id):
+        cursor, fetched = self._connect().execute(
+            "SELECT cursor, fetched FROM broadcasts WHERE id = ?",
+            (broadcast_id,)
+        ).fetchone()
+        return cursor, bool(fetched)
+
+    async def fetch_state(self, broadcast_id: int) -> Tuple[Optional[int], bool]:
+        return await self._run(self._fetch_state, broadcast_id)
+
+    def _pending_page(self, broadcast_id, after, limit):
+        return [row[0] for row in self._connect().execute(
+            "SELECT telegram_id FROM recipients WHERE broadcast_id = ? AND state = 'pending' "
+            "AND telegram_id > ? ORDER BY telegram_id LIMIT ?",
+            (broadcast_id, after, limit)
+        )]
+
+    async def iter_pending(self, broadcast_id: int, page_size: int = 500) -> AsyncIterator[int]:
+        """Yield pending recipients page by page, keyed on telegram_id so concurrent updates don't shift pages."""
+        after = -1
+        while True:
+            page = await self._run(self._pending_page, broadcast_id, after, page_size)
+            if not page:
+                return
+            for telegram_id in page:
+                yield telegram_id
+            after = page[-1]
+
+    def _mark(self, broadcast_id, results):
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "UPDATE recipients SET state = ?, attempts = attempts + 1 "
+                "WHERE broadcast_id = ? AND telegram_id = ?",
+                ((state, broadcast_id, telegram_id) for telegram_id, state in results)
+            )
+
+    async def mark(self, broadcast_id: int, results: List[tuple]):
+        await self._run(self._mark, broadcast_id, results)
+
+    def _counts(self, broadcast_id):
+        rows = self._connect().execute(
+            "SELECT state, COUNT(*) FROM recipients WHERE broadcast_id = ? GROUP BY state",
+            (broadcast_id,)
+        )
+        counts = {'pending': 0, 'delivered': 0, 'blocked': 0, 'failed': 0}
+        counts.update(dict(rows))
+        return counts
+
+    async def counts(self, broadcast_id: int) -> Dict[str, int]:
+        return await self._run(self._counts, broadcast_id)
+
+    def _finish(self, broadcast_id):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "UPDATE broadcasts SET finished_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (broadcast_id,)
+            )
+
+    async def finish(self, broadcast_id: int):
+        await self._run(self._finish, broadcast_id)
+
+    def _unfinished(self):
+        return self._connect().execute(
+            "SELECT id, text, admin_chat_id FROM broadcasts WHERE finished_at IS NULL ORDER BY id"
+        ).fetchall()
+
+    async def unfinished(self) -> List[tuple]:
+        return await self._run(self._unfinished)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class DeliveryRecorder:
+    """
+    Buffers per-recipient results, writes them to the outbox in batches and reports
+    the running delivered count to the API after every flush.
+
+    A crash loses at most one unflushed batch; those recipients are still pending and
+    will be sent again on resume.
+    """
+
+    def __init__(
+        self,
+        outbox: BroadcastOutbox,
+        broadcast_id: int,
+        batch_size: int = BROADCAST_REPORT_BATCH,
+        interval: float = BROADCAST_REPORT_INTERVAL
+    ):
+        self.outbox = outbox
+        self.broadcast_id = broadcast_id
+        self.batch_size = batch_size
+        self.interval = interval
+        self.buffer = []
+        self.flushed_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def __call__(self, telegram_id: int, state: str):
+        self.buffer.append((telegram_id, state))
+        if len(self.buffer) >= self.batch_size or time.monotonic() - self.flushed_at >= self.interval:
+            await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            results, self.buffer = self.buffer, []
+            self.flushed_at = time.monotonic()
+            if results:
+                await self.outbox.mark(self.broadcast_id, results)
+
+            counts = await self.outbox.counts(self.broadcast_id)
+
+        try:
+            await update_broadcast_status(self.broadcast_id, counts['delivered'])
+        except Exception as e:
+            logger.error(f"Failed to report status of broadcast {self.broadcast_id}: {e}")
+
+        return counts
+
+
+outbox = BroadcastOutbox()
@@ -0,0 +1,75 @@
+from typing import Any, Dict, List
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InputMediaDocument, Message, URLInputFile
+
+from utils.api import set_task_file_ids
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+MEDIA_GROUP_SIZE = 10
+
+
+def _input_file(file: Dict[str, Any], reupload: bool = False):
+    if file.get('telegram_file_id') and not reupload:
+        return file['telegram_file_id']
+    return URLInputFile(file['url'], filename=file.get('name'))
+
+
+async def _send_chunk(message: Message, chunk: List[Dict[str, Any]], reupload: bool = False) -> List[Message]:
+    # A media group needs at least two items
+    if len(chunk) == 1:
+        file = chunk[0]
+        return [await message.answer_document(_input_file(file, reupload), caption=f"📎 {file.get('name')}")]
+
+    return await message.answer_media_group([
+        InputMediaDocument(media=_input_file(file, reupload), caption=f"📎 {file.get('name')}")
+        for file in chunk
+    ])
+
+
+async def _send_each(message: Message, chunk: List[Dict[str, Any]]) -> List[Message]:
+    sent = []
+    for file in chunk:
+        try:
+            sent.extend(await _send_chunk(message, [file], reupload=True))
+        except Exception as e:
+            logger.error(f"Error sending file {file.get('name')}: {e}")
+            await message.answer(f"❌ Faylni yuklab bo'lmadi: {file.get('name')}", parse_mode="HTML")
+            sent.append(None)
+    return sent
+
+
+async def send_task_files(message: Message, task_id: int, files: List[Dict[str, Any]]):
+    """
+    Send a task's attachments as document albums of up to ten files.
+
+    Files the bot has sent before go by their Telegram file_id, so nothing is transferred.
+    The rest are streamed from their API URL into the upload, and the file_ids Telegram
+    assigns are saved to the API for next time. If an album can't be sent (a file_id
+    from another bot token, a missing file), its files are sent one by one from the URL.
+    """
+    files = [file for file in files if file.get('telegram_file_id') or file.get('url')]
+    new_file_ids = {}
+
+    for start in range(0, len(files), MEDIA_GROUP_SIZE):
+        chunk = files[start:start + MEDIA_GROUP_SIZE]
+        try:
+            sent = await _send_chunk(message, chunk)
+        except TelegramBadRequest as e:
+            logger.warning(f"Resending files of task {task_id} one by one: {e}")
+            sent = await _send_each(message, chunk)
+        except Exception as e:
+            logger.error(f"Error sending files of task {task_id}: {e}")
+            sent = await _send_each(message, chunk)
+
+        for file, sent_message in zip(chunk, sent):
+            document = sent_message.document if sent_message else None
+            if document and document.file_id != file.get('telegram_file_id'):
+                new_file_ids[file['id']] = document.file_id
+
+    if new_file_ids:
+        response = await set_task_file_ids(task_id, new_file_ids)
+        if not response.success:
+            logger.error(f"Failed to save file ids of task {task_id}: {response.message}")
@@ -0,0 +1,172 @@
+import asyncio
+import hmac
+import signal
+from contextlib import suppress
+from typing import Any, Dict, Optional, Set
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.types import Update
+from aiohttp import web
+from pydantic import ValidationError
+
+from config import (
+    WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_PATH, WEBHOOK_HOST, WEBHOOK_PORT,
+    WEBHOOK_MAX_CONNECTIONS, WEBHOOK_CONCURRENCY, WEBHOOK_DRAIN_TIMEOUT, DROP_PENDING_UPDATES,
+    INTERNAL_API_ENABLED, INTERNAL_API_PORT, INTERNAL_API_TOKEN
+)
+from services.internal_api import setup_internal_routes
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+def serves_internal_routes() -> bool:
+    """
+    Whether the webhook app also serves the internal API: only when it is enabled, protected
+    by a token and configured on the webhook's port. Otherwise it runs on its own server.
+    """
+    return INTERNAL_API_ENABLED and bool(INTERNAL_API_TOKEN) and INTERNAL_API_PORT == WEBHOOK_PORT
+
+
+class UpdateExecutor:
+    """
+    Runs webhook updates in the background, at most `concurrency` at a time.
+
+    The webhook answers Telegram as soon as an update has a slot, so a slow handler never
+    holds up the next update. When every slot is busy, submit() waits for one before the
+    request is answered, which pushes back on Telegram (it holds at most
+    WEBHOOK_MAX_CONNECTIONS requests open) instead of piling up unbounded tasks.
+
+    Updates of one chat are not serialized, as with polling: the media group collector
+    relies on the items of an album being handled side by side.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, concurrency: int = WEBHOOK_CONCURRENCY):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.slots = asyncio.Semaphore(concurrency)
+        self.tasks: Set[asyncio.Task] = set()
+        self.closed = False
+
+    async def submit(self, update: Update, **kwargs: Any) -> bool:
+        """Start processing `update` once a slot is free; False if the executor is draining."""
+        await self.slots.acquire()
+        if self.closed:
+            self.slots.release()
+            return False
+        task = asyncio.create_task(self._process(update, **kwargs))
+        self.tasks.add(task)
+        task.add_done_callback(self._done)
+        return True
+
+    def _done(self, task: asyncio.Task):
+        self.tasks.discard(task)
+        self.slots.release()
+
+    async def _process(self, update: Update, **kwargs: Any):
+        try:
+            result = await self.dispatcher.feed_update(self.bot, update, **kwargs)
+            # A handler may answer with a method meant for the webhook response
+            if isinstance(result, TelegramMethod):
+                await self.dispatcher.silent_call_request(self.bot, result)
+        except Exception as e:
+            logger.error(f"Error processing update {update.update_id}: {e}")
+
+    async def drain(self, timeout: float = WEBHOOK_DRAIN_TIMEOUT) -> int:
+        """
+        Stop taking updates and wait up to `timeout` seconds for those in progress;
+        returns how many had to be cancelled.
+        """
+        self.closed = True
+        if not self.tasks:
+            return 0
+
+        logger.info(f"Waiting for {len(self.tasks)} update(s) to finish")
+        _, pending = await asyncio.wait(set(self.tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+        return len(pending)
+
+
+def create_webhook_app(executor: UpdateExecutor, workflow_data: Optional[Dict[str, Any]] = None) -> web.Application:
+    """Application serving Telegram updates on WEBHOOK_PATH and, if configured, the internal API routes."""
+    workflow_data = workflow_data or {}
+    bot = executor.bot
+
+    async def handle_update(request: web.Request) -> web.Response:
+        if WEBHOOK_SECRET:
+            token = request.headers.get(SECRET_HEADER, '')
+            if not hmac.compare_digest(token, WEBHOOK_SECRET):
+                return web.json_response({'message': 'Unauthorized'}, status=401)
+
+        try:
+            update = Update.model_validate(await request.json(), context={'bot': bot})
+        except (ValueError, ValidationError):
+            return web.json_response({'message': 'Invalid update'}, status=400)
+
+        if executor.closed or not await executor.submit(update, **workflow_data):
+            # Telegram keeps the update and delivers it again, to the next process
+            return web.json_response({'message': 'Shutting down'}, status=503)
+        return web.json_response({})
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handle_update)
+    if serves_internal_routes():
+        setup_internal_routes(app)
+    return app
+
+
+async def run_webhook(dispatcher: Dispatcher, bot: Bot):
+    """
+    Serve updates through a webhook until SIGINT/SIGTERM, then stop taking updates,
+    drain the ones in progress and shut the dispatcher down.
+
+    The webhook is left registered on exit, so Telegram keeps the updates that arrive
+    while the bot restarts and delivers them to the next process.
+    """
+    if not WEBHOOK_URL:
+        raise ValueError("WEBHOOK_URL environment variable is not set")
+    if not WEBHOOK_SECRET:
+        raise ValueError("WEBHOOK_SECRET environment variable is not set")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    with suppress(NotImplementedError):
+        # Signal handlers are not supported on Windows
+        loop.add_signal_handler(signal.SIGTERM, stop.set)
+        loop.add_signal_handler(signal.SIGINT, stop.set)
+
+    workflow_data = {'dispatcher': dispatcher, 'bots': [bot], **dispatcher.workflow_data}
+    executor = UpdateExecutor(dispatcher, bot)
+    runner = web.AppRunner(create_webhook_app(executor, workflow_data))
+
+    await dispatcher.emit_startup(bot=bot, **workflow_data)
+    try:
+        await runner.setup()
+        await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+        await bot.set_webhook(
+            WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=dispatcher.resolve_used_update_types(),
+            drop_pending_updates=DROP_PENDING_UPDATES
+        )
+        logger.info(f"Webhook listening on {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+        await stop.wait()
+    finally:
+        cancelled = await executor.drain()
+        if cancelled:
+            logger.warning(f"Cancelled {cancelled} update(s) still running after {WEBHOOK_DRAIN_TIMEOUT}s")
+        await runner.cleanup()
+        try:
+            await dispatcher.emit_shutdown(bot=bot, **workflow_data)
+        finally:
+            await bot.session.close()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            with suppress(NotImplementedError):
+                loop.remove_signal_handler(sig)
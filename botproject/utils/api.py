@@ -1,62 +1,147 @@
 import aiohttp
 import asyncio
-from typing import Dict, Any, Tuple, List, Optional, Union
+from typing import Dict, Any, Awaitable, BinaryIO, Tuple, List, Optional, Union, Callable
 from datetime import datetime
 import json
 import hashlib
+import time
 from contextlib import suppress
+from contextvars import ContextVar
 import mimetypes
 import os
+import tempfile
 from aiogram import Bot
 from config import (
     API_URL,
     API_TIMEOUT,
+    API_UPLOAD_TIMEOUT,
     API_RETRY_COUNT,
     API_RETRY_DELAY,
     API_POOL_SIZE,
     BOT_TOKEN,
     CACHE_TTL,
-    API_BASE_URL
+    API_POOL_PER_HOST,
+    API_KEEPALIVE_TIMEOUT,
+    API_RETRY_MAX_DELAY,
+    TELEGRAM_DOWNLOAD_CONCURRENCY,
+    UPLOAD_CHUNK_SIZE
 )
 from utils.logger import setup_logger
 from utils.cache import cache
+from utils.resilience import (
+    IDEMPOTENT_METHODS, api_deadline, breakers, decorrelated_jitter, endpoint_key, remaining_budget
+)
 from functools import wraps
-from dataclasses import dataclass
 
 logger = setup_logger(__name__)
 
 def cache_key(func_name: str, *args, **kwargs) -> str:
+    # The client instance's repr differs per process, so it is left out of shared keys
+    args = tuple(arg for arg in args if not isinstance(arg, APIClient))
     key = f"{func_name}:{str(args)}:{str(kwargs)}"
     return hashlib.md5(key.encode()).hexdigest()
 
-def cached(ttl: int = CACHE_TTL):
+RETRYABLE_STATUSES = frozenset({502, 503, 504})
+
+_inflight: Dict[str, Tuple[asyncio.Task, int]] = {}
+
+class _CachedResult:
+    __slots__ = ('value', 'fresh_until')
+
+    def __init__(self, value: Any, fresh_until: float):
+        self.value = value
+        self.fresh_until = fresh_until
+
+def cached(
+    ttl: int = CACHE_TTL,
+    stale_ttl: int = 0,
+    negative_ttl: int = 0,
+    tags: Optional[Callable[..., List[str]]] = None
+):
+    """
+    Cache successful APIResponses for `ttl` seconds.
+
+    Concurrent misses for the same key share one in-flight task, so a burst of identical
+    calls costs a single backend request. Callers await it through asyncio.shield, so a
+    cancelled caller doesn't cancel the request the others are waiting on.
+
+    With `stale_ttl`, an expired entry is still returned for that many extra seconds
+    while a single background refresh replaces it. With `negative_ttl`, 404 responses
+    are cached for that long so unknown ids don't reach the backend on every call.
+    `tags(result, *args, **kwargs)` returns the tags to store the entry under, so writes
+    can evict it with cache.ainvalidate_tags(). A response fetched across an invalidation
+    is returned to its callers but not cached.
+    """
     def decorator(func):
+        async def store(key: str, result: Any, args, kwargs):
+            if not isinstance(result, APIResponse):
+                return
+            now = time.time()
+            if result.success:
+                entry_tags = tags(result, *args, **kwargs) if tags else ()
+                await cache.aset(key, _CachedResult(result, now + ttl), timeout=ttl + stale_ttl, tags=entry_tags)
+            elif negative_ttl and result.status_code == 404:
+                entry_tags = tags(None, *args, **kwargs) if tags else ()
+                await cache.aset(key, _CachedResult(result, now + negative_ttl), timeout=negative_ttl, tags=entry_tags)
+
+        def fetch(key: str, args, kwargs) -> asyncio.Task:
+            inflight = _inflight.get(key)
+            if inflight is not None and inflight[1] == cache.generation:
+                return inflight[0]
+
+            generation = cache.generation
+
+            async def run():
+                result = await func(*args, **kwargs)
+                if generation == cache.generation:
+                    await store(key, result, args, kwargs)
+                return result
+
+            task = asyncio.ensure_future(run())
+            _inflight[key] = (task, generation)
+
+            def on_done(done: asyncio.Task):
+                if _inflight.get(key, (None,))[0] is done:
+                    del _inflight[key]
+                if not done.cancelled() and done.exception() is not None:
+                    logger.warning(f"{func.__name__} refresh failed: {done.exception()}")
+
+            task.add_done_callback(on_done)
+            return task
+
         @wraps(func)
         async def wrapper(*args, **kwargs):
             key = cache_key(func.__name__, *args, **kwargs)
 
-            cached_data = cache.get(key)
-            if cached_data:
-                return cached_data
-
-            result = await func(*args, **kwargs)
+            entry = await cache.aget(key)
+            if entry is not None:
+                if entry.fresh_until <= time.time():
+                    fetch(key, args, kwargs)
+                return entry.value
 
-            if isinstance(result, APIResponse) and result.success:
-                cache.set(key, result, timeout=ttl)
-                cache.cleanup()
+            return await asyncio.shield(fetch(key, args, kwargs))
 
-            return result
         return wrapper
     return decorator
 
-@dataclass
-class ApiResponse:
-    success: bool
-    data: Dict[str, Any] = None
-    message: str = None
-    status_code: int = 200
+def user_tags(result, client, telegram_id: int) -> List[str]:
+    return [f"user:{telegram_id}"]
+
+def user_tasks_tags(result, client, telegram_id: int) -> List[str]:
+    tags = [f"user:{telegram_id}"]
+    if result is not None:
+        tags.extend(f"task:{task['id']}" for task in result.data.get('tasks', []))
+    return tags
+
+def task_tags(result, client, task_id: int) -> List[str]:
+    return [f"task:{task_id}"]
 
 class APIResponse:
+    # Set by services.offline on responses served from a local snapshot or queued writes
+    stale = False
+    saved_at: Optional[float] = None
+    queued = False
+
     def __init__(
         self,
         data: Dict[str, Any],
@@ -83,11 +168,66 @@ class APIError(Exception):
         self.status_code = status_code
         super().__init__(self.message)
 
+def idempotency_headers(key: Optional[str]) -> Dict[str, str]:
+    """Headers that let the API drop a repeated write (see the idempotent view decorator)."""
+    return {'Idempotency-Key': key} if key else {}
+
+class RequestBatch:
+    """
+    Collects the GET requests made by a group of concurrent calls and sends them to the
+    API's batch/ endpoint in one POST.
+
+    The batch is flushed as soon as every call has either queued a request or finished
+    without one (a cache hit, or joining a request already in flight), or `window`
+    seconds after the first request, whichever comes first. Requests made after the
+    flush, like a second request in a chained call or a background refresh, go out on
+    their own.
+    """
+
+    window = 0.01
+
+    def __init__(self, client: 'APIClient', calls: int):
+        self.client = client
+        self.waiting = calls
+        self.requests: List[Tuple[str, Optional[Dict], asyncio.Future]] = []
+        self.flushed = False
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, endpoint: str, params: Optional[Dict]) -> Optional[asyncio.Future]:
+        if self.flushed:
+            return None
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.requests.append((endpoint, params, future))
+        if self._timer is None:
+            self._timer = loop.call_later(self.window, self.flush)
+        self.settle()
+        return future
+
+    def settle(self, *_):
+        """One call has queued its request or finished."""
+        self.waiting -= 1
+        if self.waiting <= 0:
+            self.flush()
+
+    def flush(self):
+        if self.flushed:
+            return
+        self.flushed = True
+        if self._timer is not None:
+            self._timer.cancel()
+        if self.requests:
+            self._task = asyncio.ensure_future(self.client._send_batch(self.requests))
+
+_batch: ContextVar[Optional[RequestBatch]] = ContextVar('api_batch', default=None)
+
 class APIClient:
     _instance = None
     _initialized = False
     _session: Optional[aiohttp.ClientSession] = None
     _bot: Optional[Bot] = None
+    _download_slots = asyncio.Semaphore(TELEGRAM_DOWNLOAD_CONCURRENCY)
 
     def __new__(cls):
         if cls._instance is None:
@@ -115,6 +255,8 @@ class APIClient:
         if cls._session is None or cls._session.closed:
             connector = aiohttp.TCPConnector(
                 limit=API_POOL_SIZE,
+                limit_per_host=API_POOL_PER_HOST,
+                keepalive_timeout=API_KEEPALIVE_TIMEOUT,
                 ttl_dns_cache=300,
                 enable_cleanup_closed=True
             )
@@ -134,11 +276,11 @@ class APIClient:
     async def close(cls):
         if cls._session and not cls._session.closed:
             with suppress(Exception):
-                await self._session.close()
+                await cls._session.close()
             cls._session = None
         if cls._bot:
             with suppress(Exception):
-                await self._bot.session.close()
+                await cls._bot.session.close()
             cls._bot = None
 
     async def _make_request(
@@ -147,18 +289,55 @@ class APIClient:
         endpoint: str,
         data: Optional[Union[Dict, aiohttp.FormData]] = None,
         params: Optional[Dict] = None,
-        files: Optional[List[Dict]] = None
+        files: Optional[List[Dict]] = None,
+        idempotent: Optional[bool] = None,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None
     ) -> APIResponse:
+        """
+        Send one API request. Inside APIClient.batch(), GETs are queued into the batch instead.
+
+        Every endpoint (with ids folded out) has its own circuit breaker, so a failing
+        route fails fast without blocking the rest. Only idempotent methods are retried,
+        with decorrelated-jitter backoff, and no attempt or sleep may run past the
+        deadline set by api_deadline() (see DeadlineMiddleware). Each attempt is capped at
+        `timeout` seconds, API_TIMEOUT by default.
+        """
+        method = method.upper()
+        collector = _batch.get()
+        if collector is not None and method == 'GET':
+            future = collector.add(endpoint, params)
+            if future is not None:
+                return await future
+
         session = await self.ensure_session()
         url = f"{self.base_url}/{endpoint.lstrip('/')}"
-        headers = {}
+        headers = dict(headers or {})
 
         if isinstance(data, dict):
             headers['Content-Type'] = 'application/json'
             data = json.dumps(data)
 
+        breaker = breakers.get(endpoint_key(method, endpoint))
+        if not breaker.allow():
+            raise APIError("Service temporarily unavailable", 503)
+
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        attempts = self.retry_count if idempotent else 1
+        delay = self.retry_delay
+        attempt_timeout = timeout or API_TIMEOUT
+
         try:
-            for attempt in range(1, self.retry_count + 1):
+            for attempt in range(1, attempts + 1):
+                budget = remaining_budget()
+                if budget is not None and budget <= 0:
+                    raise APIError("Request deadline exceeded", 408)
+                if budget is None:
+                    request_timeout = aiohttp.ClientTimeout(total=attempt_timeout)
+                else:
+                    request_timeout = aiohttp.ClientTimeout(total=min(budget, attempt_timeout))
+
                 try:
                     async with session.request(
                         method=method,
@@ -166,25 +345,114 @@ class APIClient:
                         data=data,
                         params=params,
                         headers=headers,
-                        timeout=self.timeout
+                        timeout=request_timeout
                     ) as response:
+                        if response.status in RETRYABLE_STATUSES and attempt < attempts:
+                            raise aiohttp.ClientResponseError(
+                                response.request_info, response.history, status=response.status
+                            )
+
                         try:
                             result = await response.json()
-                            return APIResponse(result, response.status)
                         except aiohttp.ContentTypeError:
                             text = await response.text()
-                            self.logger.error(f"Invalid JSON response: {text}")
+                            self.logger.error(f"Invalid JSON response: {text[:500]}")
+                            if response.status >= 500:
+                                breaker.record_failure()
+                            else:
+                                breaker.record_success()
                             raise APIError("Invalid response format", response.status)
+
+                        if response.status >= 500:
+                            breaker.record_failure()
+                        else:
+                            breaker.record_success()
+                        return APIResponse(result, response.status)
                 except (aiohttp.ClientError, asyncio.TimeoutError) as e:
-                    if attempt == self.retry_count:
-                        raise
-                    await asyncio.sleep(self.retry_delay * attempt)
-        except asyncio.TimeoutError:
-            self.logger.error(f"Request timeout for {url}")
-            raise APIError("Request timeout", 408)
+                    breaker.record_failure()
+
+                    if attempt == attempts or not breaker.allow():
+                        self.logger.error(f"Request error for {method} {url}: {e.__class__.__name__} {e}")
+                        if isinstance(e, asyncio.TimeoutError):
+                            raise APIError("Request timeout", 408)
+                        if isinstance(e, aiohttp.ClientResponseError):
+                            raise APIError("Service temporarily unavailable", e.status)
+                        raise APIError(str(e) or e.__class__.__name__, 503)
+
+                    delay = decorrelated_jitter(self.retry_delay, API_RETRY_MAX_DELAY, delay)
+                    budget = remaining_budget()
+                    if budget is not None and budget <= delay:
+                        raise APIError("Request deadline exceeded", 408)
+                    await asyncio.sleep(delay)
+        finally:
+            # A half-open probe that ends without a verdict (deadline, cancellation)
+            # must not leave the breaker waiting for it forever
+            breaker.release()
+
+    async def batch(self, *calls: Awaitable[Any]) -> List[Any]:
+        """
+        Await `calls` concurrently and return their results in order, like asyncio.gather,
+        but send the GET requests they make as a single batch/ request:
+
+            task, user = await api_client.batch(get_task_detail(task_id), get_user_info(user_id))
+
+        Calls go through their usual caching, so cached results cost nothing.
+        """
+        collector = RequestBatch(self, len(calls))
+        token = _batch.set(collector)
+        try:
+            tasks = [asyncio.ensure_future(call) for call in calls]
+        finally:
+            _batch.reset(token)
+
+        for task in tasks:
+            task.add_done_callback(collector.settle)
+        return await asyncio.gather(*tasks)
+
+    async def _send_batch(self, requests: List[Tuple[str, Optional[Dict], asyncio.Future]]):
+        try:
+            results = await self._fetch_batch(requests)
         except Exception as e:
-            self.logger.error(f"Request error: {str(e)}")
-            raise APIError(str(e))
+            results = [e] * len(requests)
+
+        for (_, _, future), result in zip(requests, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def _fetch_batch(self, requests) -> List[Union[APIResponse, BaseException]]:
+        if len(requests) > 1:
+            try:
+                response = await self._make_request(
+                    'POST',
+                    'batch/',
+                    {'requests': {
+                        str(i): {'path': endpoint, 'params': params or {}}
+                        for i, (endpoint, params, _) in enumerate(requests)
+                    }},
+                    idempotent=True
+                )
+            except APIError as e:
+                if e.status_code not in (404, 405):
+                    raise
+            else:
+                if response.status_code not in (404, 405):
+                    if not response.success:
+                        raise APIError(response.message or "Batch request failed", response.status_code)
+                    responses = [response.data['responses'][str(i)] for i in range(len(requests))]
+                    return [
+                        APIResponse(sub['data'] if sub['data'] is not None else {}, sub['status'])
+                        for sub in responses
+                    ]
+
+        # A single request, or an API without batch/: send them side by side
+        return await asyncio.gather(
+            *(self._make_request('GET', endpoint, params=params) for endpoint, params, _ in requests),
+            return_exceptions=True
+        )
 
     @staticmethod
     def clean_phone_number(phone: str) -> str:
@@ -202,7 +470,7 @@ class APIClient:
             raise ValueError("Invalid JSHIR format")
         return jshir
 
-    @cached(ttl=300)
+    @cached(ttl=600, stale_ttl=3600, negative_ttl=30, tags=user_tags)
     async def get_user_info(self, telegram_id: int) -> APIResponse:
         return await self._make_request(
             'GET',
@@ -220,7 +488,7 @@ class APIClient:
             phone = self.clean_phone_number(phone)
             jshir = self.validate_jshir(jshir)
 
-            return await self._make_request(
+            response = await self._make_request(
                 'POST',
                 'verify-user/',
                 {
@@ -229,10 +497,13 @@ class APIClient:
                     'telegram_id': telegram_id
                 }
             )
+            if response.success:
+                await cache.ainvalidate_tags(f"user:{telegram_id}")
+            return response
         except ValueError as e:
             return APIResponse({'message': str(e)}, 400, str(e))
 
-    @cached(ttl=60)
+    @cached(ttl=600, tags=user_tasks_tags)
     async def get_user_tasks(self, telegram_id: int) -> APIResponse:
         return await self._make_request(
             'GET',
@@ -240,11 +511,11 @@ class APIClient:
             params={'telegram_id': telegram_id}
         )
 
-    @cached(ttl=60)
+    @cached(ttl=600, tags=task_tags)
     async def get_task_detail(self, task_id: int) -> APIResponse:
         return await self._make_request('GET', f'tasks/{task_id}/')
 
-    @cached(ttl=60)
+    @cached(ttl=600, tags=task_tags)
     async def get_task_stats(self, task_id: int) -> APIResponse:
         return await self._make_request('GET', f'tasks/{task_id}/stats/')
 
@@ -253,7 +524,8 @@ class APIClient:
         task_id: int,
         status: str,
         telegram_id: int,
-        rejection_reason: Optional[str] = None
+        rejection_reason: Optional[str] = None,
+        idempotency_key: Optional[str] = None
     ) -> APIResponse:
         data = {
             'status': status,
@@ -262,43 +534,72 @@ class APIClient:
         if rejection_reason:
             data['rejection_reason'] = rejection_reason
 
-        return await self._make_request(
-            'PATCH',
-            f'tasks/{task_id}/status/',
-            data
-        )
+        try:
+            return await self._make_request(
+                'PATCH',
+                f'tasks/{task_id}/status/',
+                data,
+                headers=idempotency_headers(idempotency_key)
+            )
+        finally:
+            await cache.ainvalidate_tags(f"task:{task_id}")
 
     async def submit_task_progress(
         self,
         task_id: int,
         telegram_id: int,
         description: str,
-        files: Optional[List[Dict[str, str]]] = None
+        files: Optional[List[Dict[str, str]]] = None,
+        idempotency_key: Optional[str] = None
     ) -> APIResponse:
-        """Submit progress for a task with optional files"""
+        """
+        Submit progress for a task with optional files.
+
+        Attachments are downloaded from Telegram concurrently (at most
+        TELEGRAM_DOWNLOAD_CONCURRENCY at a time) into temporary files, then streamed
+        into the multipart upload chunk by chunk, so memory use doesn't grow with
+        file size and all downloads together take about as long as the slowest one.
+
+        The whole transfer gets its own API_UPLOAD_TIMEOUT budget in place of the
+        update's API_UPDATE_DEADLINE, which is sized for ordinary calls.
+        """
+        spooled = []
         try:
-            # Create form data
-            form = aiohttp.FormData()
-            form.add_field('task_id', str(task_id))
-            form.add_field('telegram_id', str(telegram_id))
-            form.add_field('description', description)
-
-            # Add files if provided
-            if files:
-                for i, file_data in enumerate(files):
-                    file_id = file_data.get('file_id')
-                    if file_id:
-                        file_content = await self.download_telegram_file(file_id)
-                        if file_content:
+            with api_deadline(API_UPLOAD_TIMEOUT, replace=True):
+                # Create form data
+                form = aiohttp.FormData()
+                form.add_field('task_id', str(task_id))
+                form.add_field('telegram_id', str(telegram_id))
+                form.add_field('description', description)
+
+                # Add files if provided
+                if files:
+                    attachments = [(i, file_data) for i, file_data in enumerate(files) if file_data.get('file_id')]
+                    downloads = await asyncio.gather(*(
+                        self.download_telegram_file(file_data['file_id'], file_data.get('file_name'))
+                        for _, file_data in attachments
+                    ))
+                    for (i, _), download in zip(attachments, downloads):
+                        if download:
+                            spooled.append(download[0])
                             form.add_field(
                                 f'file_{i}',  # Use indexed field names instead of files[]
-                                file_content[0],
-                                filename=file_content[1],
-                                content_type=file_content[2]
+                                download[0],
+                                filename=download[1],
+                                content_type=download[2]
                             )
 
-            # Make the API request
-            return await self._make_request('POST', 'submit-progress/', form)
+                # Make the API request
+                return await self._make_request(
+                    'POST',
+                    'submit-progress/',
+                    form,
+                    headers=idempotency_headers(idempotency_key),
+                    timeout=API_UPLOAD_TIMEOUT
+                )
+        except APIError as e:
+            logger.error(f"API error in submit_task_progress: {e.message}")
+            return APIResponse({"message": "Topshiriqni yuborishda xatolik yuz berdi"}, e.status_code, e.message)
         except Exception as e:
             logger.error(f"Exception in submit_task_progress: {e}")
             return APIResponse(
@@ -306,23 +607,36 @@ class APIClient:
                 500, 
                 str(e)
             )
+        finally:
+            for spool in spooled:
+                spool.close()
+            await cache.ainvalidate_tags(f"task:{task_id}")
 
     async def download_telegram_file(
         self,
-        file_id: str
-    ) -> Optional[Tuple[bytes, str, str]]:
-        try:
-            bot = await self.get_bot()
-            file = await bot.get_file(file_id)
-            file_path = file.file_path
-            file_name = os.path.basename(file_path)
-            content_type = mimetypes.guess_type(file_name)[0] or 'application/octet-stream'
-
-            file_content = await bot.download_file(file_path)
-            return file_content.read(), file_name, content_type
-        except Exception as e:
-            self.logger.error(f"File download error: {e}")
-            return None
+        file_id: str,
+        file_name: Optional[str] = None
+    ) -> Optional[Tuple[BinaryIO, str, str]]:
+        """
+        Download a Telegram file into a temporary file, UPLOAD_CHUNK_SIZE bytes at a time.
+        Returns (file positioned at the start, file name, content type); the caller closes
+        the file, which deletes it.
+        """
+        async with self._download_slots:
+            spool = tempfile.TemporaryFile()
+            try:
+                bot = await self.get_bot()
+                file = await bot.get_file(file_id)
+                file_path = file.file_path
+                file_name = file_name or os.path.basename(file_path)
+                content_type = mimetypes.guess_type(file_name)[0] or 'application/octet-stream'
+
+                await bot.download_file(file_path, spool, timeout=int(API_UPLOAD_TIMEOUT), chunk_size=UPLOAD_CHUNK_SIZE)
+                return spool, file_name, content_type
+            except Exception as e:
+                spool.close()
+                self.logger.error(f"File download error: {e}")
+                return None
 
     async def grade_task(
         self,
@@ -341,11 +655,14 @@ class APIClient:
         if admin_id:
             data['admin_id'] = admin_id
         
-        return await self._make_request(
-            'POST',
-            'grade-task/',
-            data
-        )
+        try:
+            return await self._make_request(
+                'POST',
+                'grade-task/',
+                data
+            )
+        finally:
+            await cache.ainvalidate_tags(f"task:{task_id}")
 
     async def get_statistics(self, period: str) -> APIResponse:
         """Get statistics for a specific period (daily, monthly, all)"""
@@ -379,6 +696,60 @@ class APIClient:
             data
         )
 
+    async def get_broadcast_recipients(
+        self,
+        broadcast_id: int,
+        cursor: Optional[int] = None,
+        limit: Optional[int] = None
+    ) -> APIResponse:
+        """Get one page of a broadcast's recipient telegram ids"""
+        params = {}
+        if cursor:
+            params['cursor'] = cursor
+        if limit:
+            params['limit'] = limit
+
+        return await self._make_request(
+            'GET',
+            f'broadcasts/{broadcast_id}/recipients/',
+            params=params
+        )
+
+    async def update_broadcast_status(self, broadcast_id: int, delivered_count: int) -> APIResponse:
+        """Report how many recipients a broadcast has reached so far"""
+        return await self._make_request(
+            'POST',
+            'webhook/broadcast-status/',
+            {
+                'broadcast_id': broadcast_id,
+                'delivered_count': delivered_count
+            }
+        )
+
+    async def set_task_file_ids(self, task_id: int, file_ids: Dict[int, str]) -> APIResponse:
+        """Save the Telegram file_ids of uploaded task files so they are resent without a transfer"""
+        try:
+            return await self._make_request(
+                'POST',
+                'task-files/telegram-ids/',
+                {'files': {str(file_id): telegram_file_id for file_id, telegram_file_id in file_ids.items()}}
+            )
+        finally:
+            await cache.ainvalidate_tags(f"task:{task_id}")
+
+    async def get_user_role(self, telegram_id: int) -> APIResponse:
+        """Fetch a user's profile for a role check, bypassing the cache so it is never stale"""
+        return await self._make_request(
+            'GET',
+            'user-info/',
+            params={'telegram_id': telegram_id}
+        )
+
+    async def get_staff_telegram_ids(self) -> APIResponse:
+        """Get telegram ids of every active staff user"""
+        return await self._make_request('GET', 'users/staff-ids/')
+
+    @cached(ttl=3600)
     async def get_districts(self) -> APIResponse:
         """Get list of districts"""
         return await self._make_request(
@@ -386,6 +757,7 @@ class APIClient:
             'districts/'
         )
 
+    @cached(ttl=3600)
     async def get_mahallas(self) -> APIResponse:
         """Get list of mahallas"""
         return await self._make_request(
@@ -393,67 +765,31 @@ class APIClient:
             'mahallas/'
         )
 
-async def make_request(method: str, endpoint: str, data: Dict = None, params: Dict = None) -> ApiResponse:
-    url = f"{API_BASE_URL}{endpoint}"
-    
-    try:
-        async with aiohttp.ClientSession() as session:
-            if method.lower() == "get":
-                async with session.get(url, params=params) as response:
-                    status_code = response.status
-                    response_text = await response.text()
-                    
-                    try:
-                        response_data = json.loads(response_text)
-                        return ApiResponse(
-                            success=True,
-                            data=response_data,
-                            status_code=status_code
-                        )
-                    except json.JSONDecodeError:
-                        logger.error(f"Invalid response format: {response_text}")
-                        return ApiResponse(
-                            success=False,
-                            message="Invalid response format",
-                            status_code=status_code
-                        )
-            elif method.lower() == "post":
-                async with session.post(url, json=data) as response:
-                    status_code = response.status
-                    response_text = await response.text()
-                    
-                    try:
-                        response_data = json.loads(response_text)
-                        if status_code >= 400:
-                            return ApiResponse(
-                                success=False,
-                                message=response_data.get('message', 'Request failed'),
-                                status_code=status_code
-                            )
-                        return ApiResponse(
-                            success=True,
-                            data=response_data,
-                            status_code=status_code
-                        )
-                    except json.JSONDecodeError:
-                        logger.error(f"Invalid response format: {response_text}")
-                        return ApiResponse(
-                            success=False,
-                            message="Invalid response format",
-                            status_code=status_code
-                        )
-    except aiohttp.ClientError as e:
-        logger.error(f"Request error: {str(e)}")
-        return ApiResponse(
-            success=False,
-            message=f"Request error: {str(e)}"
-        )
-    except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}")
-        return ApiResponse(
-            success=False,
-            message=f"Unexpected error: {str(e)}"
-        )
+    async def get_tasks(
+        self,
+        user_id: Optional[int] = None,
+        mahalla_id: Optional[int] = None,
+        district_id: Optional[int] = None,
+        status: Optional[str] = None,
+        cursor: Optional[int] = None,
+        limit: Optional[int] = None
+    ) -> APIResponse:
+        """Get one page of tasks, newest first"""
+        params = {}
+        if user_id:
+            params['user_id'] = user_id
+        if mahalla_id:
+            params['mahalla_id'] = mahalla_id
+        if district_id:
+            params['district_id'] = district_id
+        if status:
+            params['status'] = status
+        if cursor:
+            params['cursor'] = cursor
+        if limit:
+            params['limit'] = limit
+
+        return await self._make_request('GET', 'tasks/', params=params)
 
 api_client = APIClient()
 
@@ -464,6 +800,9 @@ async def verify_user(
 ) -> APIResponse:
     return await api_client.verify_user(phone, jshir, telegram_id)
 
+async def batch(*calls: Awaitable[Any]) -> List[Any]:
+    return await api_client.batch(*calls)
+
 async def get_user_info(telegram_id: int) -> APIResponse:
     return await api_client.get_user_info(telegram_id)
 
@@ -480,32 +819,37 @@ async def update_task_status(
     task_id: int,
     status: str,
     telegram_id: int,
-    rejection_reason: Optional[str] = None
+    rejection_reason: Optional[str] = None,
+    idempotency_key: Optional[str] = None
 ) -> APIResponse:
     return await api_client.update_task_status(
         task_id,
         status,
         telegram_id,
-        rejection_reason
+        rejection_reason,
+        idempotency_key
     )
 
 async def submit_task_progress(
     task_id: int,
     telegram_id: int,
     description: str,
-    files: Optional[List[Dict[str, str]]] = None
+    files: Optional[List[Dict[str, str]]] = None,
+    idempotency_key: Optional[str] = None
 ) -> APIResponse:
     return await api_client.submit_task_progress(
         task_id,
         telegram_id,
         description,
-        files
+        files,
+        idempotency_key
     )
 
 async def download_telegram_file(
-    file_id: str
-) -> Optional[Tuple[bytes, str, str]]:
-    return await api_client.download_telegram_file(file_id)
+    file_id: str,
+    file_name: Optional[str] = None
+) -> Optional[Tuple[BinaryIO, str, str]]:
+    return await api_client.download_telegram_file(file_id, file_name)
 
 async def get_statistics(period: str) -> APIResponse:
     return await api_client.get_statistics(period)
@@ -530,63 +874,43 @@ async def send_broadcast(
 ) -> APIResponse:
     return await api_client.send_broadcast(title, message, target_type, target_id, admin_id)
 
+async def get_broadcast_recipients(
+    broadcast_id: int,
+    cursor: Optional[int] = None,
+    limit: Optional[int] = None
+) -> APIResponse:
+    return await api_client.get_broadcast_recipients(broadcast_id, cursor, limit)
+
+async def update_broadcast_status(broadcast_id: int, delivered_count: int) -> APIResponse:
+    return await api_client.update_broadcast_status(broadcast_id, delivered_count)
+
+async def set_task_file_ids(task_id: int, file_ids: Dict[int, str]) -> APIResponse:
+    try:
+        return await api_client.set_task_file_ids(task_id, file_ids)
+    except APIError as e:
+        logger.error(f"Error in set_task_file_ids: {e.message}")
+        return APIResponse({}, e.status_code, e.message)
+
 async def get_districts() -> APIResponse:
-  """Get list of districts"""
-  try:
-      async with aiohttp.ClientSession() as session:
-          async with session.get(f"{API_URL}/districts/") as response:
-              if response.status == 200:
-                  districts = await response.json()
-                  return APIResponse(districts, response.status)
-              else:
-                  return APIResponse({}, response.status, "Failed to get districts")
-  except Exception as e:
-      logger.error(f"Error in get_districts: {e}")
-      return APIResponse({}, 500, str(e))
+    try:
+        return await api_client.get_districts()
+    except APIError as e:
+        logger.error(f"Error in get_districts: {e.message}")
+        return APIResponse({}, e.status_code, e.message)
 
 async def get_mahallas() -> APIResponse:
-  """Get list of mahallas"""
-  try:
-      async with aiohttp.ClientSession() as session:
-          async with session.get(f"{API_URL}/mahallas/") as response:
-              if response.status == 200:
-                  mahallas = await response.json()
-                  return APIResponse(mahallas, response.status)
-              else:
-                  return APIResponse({}, response.status, "Failed to get mahallas")
-  except Exception as e:
-      logger.error(f"Error in get_mahallas: {e}")
-      return APIResponse({}, 500, str(e))
-
-async def get_statistics(period: str) -> ApiResponse:
-    return await make_request("get", f"statistics/{period}/")
-
-async def get_tasks(user_id: Optional[int] = None, mahalla_id: Optional[int] = None, 
-                   district_id: Optional[int] = None, status: Optional[str] = None) -> ApiResponse:
-    params = {}
-    if user_id:
-        params['user_id'] = user_id
-    if mahalla_id:
-        params['mahalla_id'] = mahalla_id
-    if district_id:
-        params['district_id'] = district_id
-    if status:
-        params['status'] = status
-    
-    return await make_request("get", "tasks/", params=params)
-
-async def get_task_detail(task_id: int) -> ApiResponse:
-    return await make_request("get", f"tasks/{task_id}/")
-
-async def grade_task(task_id: int, percentage: int, status: str, admin_id: Optional[int] = None) -> ApiResponse:
-    data = {
-        "task_id": task_id,
-        "percentage": percentage,
-        "status": status
-    }
-    
-    if admin_id:
-        data["admin_id"] = admin_id
-    
-    return await make_request("post", "grade-task/", data=data)
-
+    try:
+        return await api_client.get_mahallas()
+    except APIError as e:
+        logger.error(f"Error in get_mahallas: {e.message}")
+        return APIResponse({}, e.status_code, e.message)
+
+async def get_tasks(
+    user_id: Optional[int] = None,
+    mahalla_id: Optional[int] = None,
+    district_id: Optional[int] = None,
+    status: Optional[str] = None,
+    cursor: Optional[int] = None,
+    limit: Optional[int] = None
+) -> APIResponse:
+    return await api_client.get_tasks(user_id, mahalla_id, district_id, status, cursor, limit)
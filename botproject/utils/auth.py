@@ -1,20 +1,10 @@
 import functools
-import aiohttp
 from aiogram import types
 
-from config import API_URL, ADMIN_IDS
+from utils.roles import role_resolver
 
 async def is_admin(user_id):
-    if user_id in ADMIN_IDS:
-        return True
-        
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f"{API_URL}/user-info/?telegram_id={user_id}") as response:
-            if response.status == 200:
-                data = await response.json()
-                user = data.get('user', {})
-                return user.get('is_staff', False)
-            return False
+    return await role_resolver.is_admin(user_id)
 
 def admin_only(func):
     @functools.wraps(func)
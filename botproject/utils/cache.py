@@ -1,52 +1,343 @@
-from typing import Dict, Any, Optional
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import heapq
+import itertools
+import pickle
 import time
-from config import CACHE_MAX_SIZE
+from config import CACHE_BACKEND, CACHE_MAX_SIZE, CACHE_L1_TTL, REDIS_URL, REDIS_CACHE_PREFIX
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class _Entry:
+    __slots__ = ('value', 'expires', 'seq', 'tags')
+
+    def __init__(self, value: Any, expires: float, seq: int, tags: tuple = ()):
+        self.value = value
+        self.expires = expires
+        self.seq = seq
+        self.tags = tags
+
 
 class Cache:
+    """
+    In-process LRU cache with per-entry TTL.
+
+    Entries live in an OrderedDict kept in recency order, so lookups, LRU eviction and
+    deletes are O(1). Expiry times go into a min-heap as (expires, seq, key); a heap
+    item whose seq no longer matches the live entry is stale and is skipped, so
+    overwrites and deletes never search the heap.
+
+    Entries can carry tags; invalidate_tags() drops every entry with any of the given
+    tags in time proportional to the number of entries removed.
+    """
+
     def __init__(self, max_size: int = CACHE_MAX_SIZE):
-        self.cache: Dict[str, Dict[str, Any]] = {}
+        self.cache: 'OrderedDict[str, _Entry]' = OrderedDict()
         self.max_size = max_size
+        self._heap = []
+        self._seq = itertools.count()
+        self._tags: Dict[str, set] = {}
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self.cache)
 
     def get(self, key: str) -> Optional[Any]:
-        if key not in self.cache:
+        entry = self.cache.get(key)
+        if entry is None:
+            self.misses += 1
             return None
 
-        item = self.cache[key]
-        if item['expires'] < time.time():
-            del self.cache[key]
+        if entry.expires <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
             return None
 
-        return item['value']
+        self.cache.move_to_end(key)
+        self.hits += 1
+        return entry.value
 
-    def set(self, key: str, value: Any, timeout: int = 300) -> None:
-        self.cache[key] = {
-            'value': value,
-            'expires': time.time() + timeout
-        }
+    def set(self, key: str, value: Any, timeout: int = 300, tags: Iterable[str] = ()) -> None:
+        now = time.monotonic()
+        entry = _Entry(value, now + timeout, next(self._seq), tuple(tags))
+
+        if key in self.cache:
+            self._remove(key)
+        self.cache[key] = entry
+        for tag in entry.tags:
+            self._tags.setdefault(tag, set()).add(key)
+        heapq.heappush(self._heap, (entry.expires, entry.seq, key))
+
+        self._expire(now)
+        while len(self.cache) > self.max_size:
+            self._remove(next(iter(self.cache)))
+            self.evictions += 1
 
-        if len(self.cache) > self.max_size:
-            self.cleanup(force=True)
+        if len(self._heap) > 2 * len(self.cache) + 64:
+            self._compact()
 
     def delete(self, key: str) -> None:
         if key in self.cache:
-            del self.cache[key]
+            self._remove(key)
+
+    def invalidate_tags(self, *tags: str) -> int:
+        """Drop every entry carrying any of `tags`; returns how many were removed."""
+        self.generation += 1
+        removed = 0
+        for tag in tags:
+            for key in self._tags.pop(tag, ()):
+                if key in self.cache:
+                    self._remove(key)
+                    removed += 1
+        return removed
+
+    def clear(self) -> None:
+        self.cache.clear()
+        self._heap.clear()
+        self._tags.clear()
+        self.generation += 1
 
     def cleanup(self, force: bool = False) -> None:
-        now = time.time()
-        expired_keys = [k for k, v in self.cache.items() if v['expires'] < now]
+        self._expire(time.monotonic())
+        if force:
+            self._compact()
+
+    async def aget(self, key: str) -> Optional[Any]:
+        return self.get(key)
+
+    async def aget_many(self, keys: List[str]) -> Dict[str, Any]:
+        values = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                values[key] = value
+        return values
+
+    async def aset(self, key: str, value: Any, timeout: int = 300, tags: Iterable[str] = ()) -> None:
+        self.set(key, value, timeout, tags)
+
+    async def adelete(self, key: str) -> None:
+        self.delete(key)
+
+    async def ainvalidate_tags(self, *tags: str) -> int:
+        return self.invalidate_tags(*tags)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.cache),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+    def _expire(self, now: float) -> None:
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            _, seq, key = heapq.heappop(heap)
+            entry = self.cache.get(key)
+            if entry is not None and entry.seq == seq:
+                self._remove(key)
+                self.expirations += 1
+
+    def _remove(self, key: str) -> None:
+        entry = self.cache.pop(key)
+        for tag in entry.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def _compact(self) -> None:
+        """Rebuild the heap from live entries, dropping items left behind by overwrites, deletes and evictions."""
+        self._heap = [(entry.expires, entry.seq, key) for key, entry in self.cache.items()]
+        heapq.heapify(self._heap)
+
 
-        for key in expired_keys:
-            del self.cache[key]
+class RedisCache:
+    """
+    Cache shared by every bot process, stored in Redis as pickled (value, tags) pairs.
 
-        if force and len(self.cache) > self.max_size:
-            sorted_items = sorted(
-                self.cache.items(),
-                key=lambda x: x[1]['expires']
+    A tag is a Redis set of the keys stored under it. Redis errors are logged and
+    treated as misses so an unavailable Redis only costs extra API calls.
+    """
+
+    tag_timeout = 24 * 60 * 60
+
+    def __init__(self, client=None, url: str = REDIS_URL, prefix: str = REDIS_CACHE_PREFIX):
+        if client is None:
+            import redis.asyncio as redis
+            client = redis.Redis.from_url(url, socket_connect_timeout=1, socket_timeout=1)
+        self.client = client
+        self.prefix = prefix
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def _tag(self, tag: str) -> str:
+        return f"{self.prefix}tag:{tag}"
+
+    async def aget(self, key: str) -> Optional[Any]:
+        return (await self.aget_many([key])).get(key)
+
+    async def aget_many(self, keys: List[str]) -> Dict[str, Any]:
+        return {key: value for key, (value, _) in (await self.aget_many_tagged(keys)).items()}
+
+    async def aget_many_tagged(self, keys: List[str]) -> Dict[str, Tuple[Any, tuple]]:
+        """Like aget_many, but each value comes with the tags it was stored under."""
+        if not keys:
+            return {}
+        try:
+            raw = await self.client.mget([self._key(key) for key in keys])
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Redis get failed: {e}")
+            return {}
+
+        values = {}
+        unreadable = []
+        for key, data in zip(keys, raw):
+            if data is None:
+                continue
+            try:
+                stored = pickle.loads(data)
+            except Exception as e:
+                # Corrupt, or pickled by another bot version during a deploy
+                self.errors += 1
+                logger.warning(f"Unreadable cache entry {key}: {e}")
+                unreadable.append(key)
+                continue
+            # Entries written before tags were stored alongside are treated as misses
+            if isinstance(stored, tuple) and len(stored) == 2:
+                values[key] = stored
+        for key in unreadable:
+            await self.adelete(key)
+        self.hits += len(values)
+        self.misses += len(keys) - len(values)
+        return values
+
+    async def aset(self, key: str, value: Any, timeout: int = 300, tags: Iterable[str] = ()) -> None:
+        tags = tuple(tags)
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                data = pickle.dumps((value, tags), pickle.HIGHEST_PROTOCOL)
+                pipe.set(self._key(key), data, ex=max(1, int(timeout)))
+                for tag in tags:
+                    pipe.sadd(self._tag(tag), key)
+                    pipe.expire(self._tag(tag), self.tag_timeout)
+                await pipe.execute()
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Redis set failed: {e}")
+
+    async def adelete(self, key: str) -> None:
+        try:
+            await self.client.delete(self._key(key))
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Redis delete failed: {e}")
+
+    async def ainvalidate_tags(self, *tags: str) -> int:
+        self.generation += 1
+        if not tags:
+            return 0
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                for tag in tags:
+                    pipe.smembers(self._tag(tag))
+                members = await pipe.execute()
+
+            keys = {key.decode() if isinstance(key, bytes) else key for group in members for key in group}
+            await self.client.delete(
+                *(self._key(key) for key in keys),
+                *(self._tag(tag) for tag in tags)
             )
+            return len(keys)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Redis tag invalidation failed: {e}")
+            return 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'errors': self.errors,
+        }
+
+
+class TieredCache:
+    """
+    In-process L1 in front of a shared L2.
+
+    Reads try L1 first and fall back to one pipelined L2 lookup; L2 hits are copied
+    into L1 with their tags for at most `l1_ttl` seconds, which bounds how long a
+    process can serve an entry another process has already invalidated. Entries this
+    process invalidates leave L1 at once, and an L2 read that was in flight during an
+    invalidation is not copied.
+    """
+
+    def __init__(self, l1: Cache, l2: RedisCache, l1_ttl: int = CACHE_L1_TTL):
+        self.l1 = l1
+        self.l2 = l2
+        self.l1_ttl = l1_ttl
+        self.generation = 0
+
+    async def aget(self, key: str) -> Optional[Any]:
+        return (await self.aget_many([key])).get(key)
+
+    async def aget_many(self, keys: List[str]) -> Dict[str, Any]:
+        values = await self.l1.aget_many(keys)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            generation = self.l1.generation
+            found = await self.l2.aget_many_tagged(missing)
+            for key, (value, tags) in found.items():
+                if self.l1.generation == generation:
+                    self.l1.set(key, value, self.l1_ttl, tags)
+                values[key] = value
+        return values
+
+    async def aset(self, key: str, value: Any, timeout: int = 300, tags: Iterable[str] = ()) -> None:
+        tags = tuple(tags)
+        self.l1.set(key, value, min(timeout, self.l1_ttl), tags)
+        await self.l2.aset(key, value, timeout, tags)
+
+    async def adelete(self, key: str) -> None:
+        self.l1.delete(key)
+        await self.l2.adelete(key)
+
+    async def ainvalidate_tags(self, *tags: str) -> int:
+        self.generation += 1
+        self.l1.invalidate_tags(*tags)
+        return await self.l2.ainvalidate_tags(*tags)
+
+    def stats(self) -> Dict[str, Any]:
+        return {'l1': self.l1.stats(), 'l2': self.l2.stats()}
+
 
-            items_to_remove = int(len(sorted_items) * 0.25)
-            for key, _ in sorted_items[:items_to_remove]:
-                del self.cache[key]
+def create_cache(backend: str = CACHE_BACKEND):
+    """Build the cache selected by CACHE_BACKEND: 'memory' (default) or 'redis' (memory L1 + Redis L2)."""
+    if backend == 'redis':
+        return TieredCache(Cache(), RedisCache())
+    return Cache()
 
-cache = Cache()
 
+cache = create_cache()
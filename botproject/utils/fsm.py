@@ -0,0 +1,79 @@
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from weakref import WeakValueDictionary
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.types import Message
+
+from config import MEDIA_GROUP_DELAY
+
+_locks: 'WeakValueDictionary[StorageKey, asyncio.Lock]' = WeakValueDictionary()
+
+
+def state_lock(state: FSMContext) -> asyncio.Lock:
+    """
+    Lock for one user's FSM state, for read-modify-write updates that concurrent updates
+    from the same user must not interleave. Locks nobody holds or waits on are dropped.
+    """
+    lock = _locks.get(state.key)
+    if lock is None:
+        lock = _locks[state.key] = asyncio.Lock()
+    return lock
+
+
+async def append_files(state: FSMContext, files: List[Dict[str, Any]]) -> int:
+    """Add `files` to the draft's 'files' list in one state write; returns the new total."""
+    async with state_lock(state):
+        data = await state.get_data()
+        merged = data.get('files', []) + files
+        await state.update_data(files=merged)
+        return len(merged)
+
+
+class _Album:
+    __slots__ = ('messages', 'updated_at')
+
+    def __init__(self, message: Message):
+        self.messages = [message]
+        self.updated_at = time.monotonic()
+
+
+class MediaGroupCollector:
+    """
+    Joins the messages of an album into one batch.
+
+    Telegram delivers every item of an album as a separate update within a moment of
+    each other. The first item opens a group keyed by (chat, media_group_id) and its
+    handler waits until no new item has arrived for `delay` seconds; the other items only
+    join the group. collect() returns the complete album, in order, to the first
+    handler and None to the rest, so the album is processed and acknowledged once.
+    """
+
+    def __init__(self, delay: float = MEDIA_GROUP_DELAY):
+        self.delay = delay
+        self.albums: Dict[Tuple[int, str], _Album] = {}
+
+    async def collect(self, message: Message) -> Optional[List[Message]]:
+        key = (message.chat.id, message.media_group_id)
+        album = self.albums.get(key)
+        if album is not None:
+            album.messages.append(message)
+            album.updated_at = time.monotonic()
+            return None
+
+        album = self.albums[key] = _Album(message)
+        try:
+            while True:
+                wait = album.updated_at + self.delay - time.monotonic()
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+        finally:
+            del self.albums[key]
+
+        return sorted(album.messages, key=lambda item: item.message_id)
+
+
+media_groups = MediaGroupCollector()
@@ -0,0 +1,207 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from contextlib import suppress
+from typing import Any, Dict, Optional, Set, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from config import FSM_STORAGE, FSM_STATE_TTL, FSM_DB_PATH, FSM_FLUSH_INTERVAL, REDIS_URL, FSM_REDIS_PREFIX
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fsm (
+    key TEXT PRIMARY KEY,
+    state TEXT,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS fsm_updated_at ON fsm (updated_at);
+"""
+
+
+class _Record:
+    __slots__ = ('state', 'data', 'updated_at')
+
+    def __init__(self, state: Optional[str], data: Dict[str, Any], updated_at: float):
+        self.state = state
+        self.data = data
+        self.updated_at = updated_at
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM storage in a local SQLite file, for a single bot process that must keep
+    conversations across restarts.
+
+    Every key read or written is kept in memory, which is the source of truth for reads.
+    Writes only mark the key dirty; a background task writes all dirty keys in one
+    transaction every `flush_interval` seconds, and close() writes the rest, so a crash
+    loses at most one interval of changes. A conversation untouched for `ttl` seconds
+    is dropped from memory and the file.
+    """
+
+    def __init__(
+        self,
+        path: str = FSM_DB_PATH,
+        ttl: int = FSM_STATE_TTL,
+        flush_interval: float = FSM_FLUSH_INTERVAL
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._records: Dict[str, _Record] = {}
+        self._dirty: Set[str] = set()
+        self._lock = asyncio.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+        self._purged_at = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def _load(self, key):
+        return self._connect().execute(
+            "SELECT state, data, updated_at FROM fsm WHERE key = ?",
+            (key,)
+        ).fetchone()
+
+    async def _record(self, storage_key: StorageKey) -> Tuple[str, Optional[_Record]]:
+        key = self.key_builder.build(storage_key)
+        record = self._records.get(key)
+        if record is None and key not in self._dirty:
+            async with self._lock:
+                row = await asyncio.to_thread(self._load, key)
+            # A write may have landed while the row was loading
+            record = self._records.get(key)
+            if record is None and row is not None:
+                record = self._records[key] = _Record(row[0], json.loads(row[1]), row[2])
+
+        if record is not None and record.updated_at + self.ttl <= time.time():
+            return key, None
+        return key, record
+
+    def _touch(self, key: str, record: _Record):
+        record.updated_at = time.time()
+        self._records[key] = record
+        self._dirty.add(key)
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_later())
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        key, record = await self._record(key)
+        record = record or _Record(None, {}, 0)
+        record.state = state.state if isinstance(state, State) else state
+        self._touch(key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        _, record = await self._record(key)
+        return record.state if record else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        key, record = await self._record(key)
+        record = record or _Record(None, {}, 0)
+        record.data = data.copy()
+        self._touch(key, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, record = await self._record(key)
+        return record.data.copy() if record else {}
+
+    async def _flush_later(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                # Shielded so close() cancelling the timer can't abandon a write half done
+                await asyncio.shield(self.flush())
+            except Exception as e:
+                logger.error(f"FSM flush failed: {e}")
+            if not self._dirty:
+                return
+
+    def _write(self, upserts, deletes, expired_before):
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT INTO fsm (key, state, data, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET state = excluded.state, data = excluded.data, "
+                "updated_at = excluded.updated_at",
+                upserts
+            )
+            conn.executemany("DELETE FROM fsm WHERE key = ?", ((key,) for key in deletes))
+            if expired_before is not None:
+                conn.execute("DELETE FROM fsm WHERE updated_at < ?", (expired_before,))
+
+    async def flush(self):
+        """Write every dirty key in one transaction and, at most once per TTL/10, purge idle ones."""
+        dirty, self._dirty = self._dirty, set()
+        upserts, deletes = [], []
+        for key in dirty:
+            record = self._records.get(key)
+            if record is None or (record.state is None and not record.data):
+                # The empty record stays in memory so a concurrent read can't reload the old row
+                deletes.append(key)
+            else:
+                upserts.append((key, record.state, json.dumps(record.data, ensure_ascii=False), record.updated_at))
+
+        now = time.time()
+        expired_before = None
+        if now - self._purged_at >= self.ttl / 10:
+            self._purged_at = now
+            expired_before = now - self.ttl
+            for key in [key for key, record in self._records.items() if record.updated_at < expired_before]:
+                if key not in self._dirty:
+                    del self._records[key]
+
+        if not (upserts or deletes or expired_before):
+            return
+        try:
+            async with self._lock:
+                await asyncio.to_thread(self._write, upserts, deletes, expired_before)
+        except Exception:
+            # Keep the changes for the next flush
+            self._dirty |= dirty
+            raise
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._flusher
+        await self.flush()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def create_storage(backend: str = FSM_STORAGE) -> BaseStorage:
+    """
+    Build the FSM storage selected by FSM_STORAGE: 'sqlite' (default, one process),
+    'redis' (shared by every bot process) or 'memory' (lost on restart).
+    """
+    if backend == 'redis':
+        from aiogram.fsm.storage.redis import RedisStorage
+        return RedisStorage.from_url(
+            REDIS_URL,
+            key_builder=DefaultKeyBuilder(prefix=FSM_REDIS_PREFIX, with_bot_id=True, with_destiny=True),
+            state_ttl=FSM_STATE_TTL,
+            data_ttl=FSM_STATE_TTL
+        )
+    if backend == 'memory':
+        return MemoryStorage()
+    return SQLiteStorage()
@@ -0,0 +1,135 @@
+import random
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+
+from config import API_BREAKER_THRESHOLD, API_BREAKER_RESET_TIMEOUT, API_UPDATE_DEADLINE
+
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+
+_deadline: ContextVar[Optional[float]] = ContextVar('api_deadline', default=None)
+
+_ID_SEGMENT = re.compile(r'/\d+(?=/|$)')
+
+
+def endpoint_key(method: str, endpoint: str) -> str:
+    """'GET', 'tasks/42/stats/' -> 'GET /tasks/{id}/stats/' so one breaker covers every id."""
+    path = '/' + endpoint.split('?', 1)[0].lstrip('/')
+    return f"{method.upper()} {_ID_SEGMENT.sub('/{id}', path)}"
+
+
+def decorrelated_jitter(base: float, cap: float, previous: float) -> float:
+    """Next backoff delay: uniform between base and three times the previous delay, capped."""
+    return min(cap, random.uniform(base, max(base, previous) * 3))
+
+
+@contextmanager
+def api_deadline(seconds: Optional[float], replace: bool = False):
+    """
+    Bound every API call made inside the block (including awaited helpers) to finish
+    within `seconds` from now. Nested blocks can only shorten the budget, unless
+    `replace` is set for work known to need its own, like uploads;
+    `api_deadline(None)` clears it for work that outlives the caller, like background tasks.
+    """
+    if seconds is None:
+        token = _deadline.set(None)
+    elif replace:
+        token = _deadline.set(time.monotonic() + seconds)
+    else:
+        deadline = time.monotonic() + seconds
+        current = _deadline.get()
+        token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_budget() -> Optional[float]:
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures and rejects calls for `reset_timeout`
+    seconds; then lets a single probe through and closes again if it succeeds.
+    """
+
+    def __init__(self, threshold: int = API_BREAKER_THRESHOLD, reset_timeout: float = API_BREAKER_RESET_TIMEOUT):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == 'closed':
+            return True
+        if state == 'half_open' and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def release(self):
+        """End a probe that got no verdict (deadline, cancellation), so the next call can probe."""
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.opened_at is not None or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+
+class BreakerRegistry:
+    def __init__(self):
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, key: str) -> CircuitBreaker:
+        breaker = self.breakers.get(key)
+        if breaker is None:
+            breaker = self.breakers[key] = CircuitBreaker()
+        return breaker
+
+    def stats(self) -> Dict[str, str]:
+        return {key: breaker.state for key, breaker in self.breakers.items() if breaker.state != 'closed'}
+
+
+breakers = BreakerRegistry()
+
+
+class DeadlineMiddleware(BaseMiddleware):
+    """Gives each update a total API budget shared by every call its handler makes."""
+
+    def __init__(self, seconds: float = API_UPDATE_DEADLINE):
+        self.seconds = seconds
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any]
+    ) -> Any:
+        with api_deadline(self.seconds):
+            return await handler(event, data)
@@ -0,0 +1,71 @@
+from config import ADMIN_IDS, ROLE_CACHE_TTL
+from utils.api import APIError, api_client
+from utils.cache import Cache, cache as api_cache
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class RoleResolver:
+    """
+    Answers "is this telegram user an admin?" from an in-process TTL cache.
+
+    ADMIN_IDS are always admins. Active staff ids are loaded in one request at startup;
+    anyone else is looked up once through an uncached user-info request and remembered
+    for ROLE_CACHE_TTL seconds. With the internal API enabled, the API pushes role
+    changes to invalidate(), so the TTL only matters when that notification is lost.
+    """
+
+    def __init__(self, ttl: int = ROLE_CACHE_TTL):
+        self.ttl = ttl
+        self.roles = Cache(max_size=100000)
+
+    async def is_admin(self, telegram_id: int) -> bool:
+        if telegram_id in ADMIN_IDS:
+            return True
+
+        role = self.roles.get(telegram_id)
+        if role is not None:
+            return role
+
+        try:
+            response = await api_client.get_user_role(telegram_id)
+        except APIError as e:
+            logger.warning(f"Could not resolve role for {telegram_id}: {e.message}")
+            return False
+
+        if response.success:
+            user = response.data.get('user', {})
+            # Same rule as get_staff_telegram_ids: a deactivated staff user is not an admin
+            role = bool(user.get('is_staff')) and bool(user.get('is_active'))
+        elif response.status_code == 404:
+            role = False
+        else:
+            return False
+
+        self.roles.set(telegram_id, role, self.ttl)
+        return role
+
+    async def warm_up(self) -> int:
+        """Load every staff telegram id in one request."""
+        try:
+            response = await api_client.get_staff_telegram_ids()
+        except APIError as e:
+            logger.warning(f"Role warm-up failed: {e.message}")
+            return 0
+
+        if not response.success:
+            return 0
+
+        telegram_ids = response.data.get('telegram_ids', [])
+        for telegram_id in telegram_ids:
+            self.roles.set(telegram_id, True, self.ttl)
+        return len(telegram_ids)
+
+    async def invalidate(self, telegram_id: int):
+        """Forget a user's role and their cached profile, so both are fetched again."""
+        self.roles.delete(telegram_id)
+        await api_cache.ainvalidate_tags(f"user:{telegram_id}")
+
+
+role_resolver = RoleResolver()
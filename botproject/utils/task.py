@@ -1,6 +1,6 @@
 ﻿async def notify_admins_about_completed_task(task_id: int, user_id: int):
     try:
-        from utils.api import get_task_detail, get_user_info
+        from utils.api import batch, get_task_detail, get_user_info
         from config import ADMIN_IDS
         from utils.bot import get_bot
         from keyboards.admin import get_task_grading_keyboard
@@ -8,8 +8,7 @@
         
         logger = setup_logger(__name__)
         
-        task_response = await get_task_detail(task_id)
-        user_response = await get_user_info(user_id)
+        task_response, user_response = await batch(get_task_detail(task_id), get_user_info(user_id))
         
         if not task_response.success or not user_response.success:
             logger.error("Failed to get task or user details for admin notification")
@@ -1,21 +1,21 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.urls import path
-from django.shortcuts import render, redirect
-from django.db.models import Count, Q
+from django.shortcuts import render, redirect, get_object_or_404
+from django.db.models import Count, Q, Sum
 from django.utils import timezone
 from datetime import timedelta
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, FileResponse, Http404
+from django.urls import reverse
+from django.utils.html import format_html
 from django.contrib import messages
-import csv
-import xlsxwriter
-from io import BytesIO
 import requests
 import json
 from .models import (
     Region, District, Mahallah, JobTitle, EmployeeType,
     User, DeviceSession, Task, TaskProgress, TaskFile, TaskStatus, BroadcastMessage,
-    MAHALLA_STATUS_CHOICES, TaskSubmission, SubmissionFile, TaskGrade
+    MAHALLA_STATUS_CHOICES, TaskSubmission, SubmissionFile, TaskGrade, DailyMahallaStats, ExportJob,
+    EXPORT_FORMAT_CHOICES
 )
 
 
@@ -34,6 +34,8 @@ class CustomAdminSite(admin.AdminSite):
             path('export/tasks/', self.admin_view(self.export_tasks), name='export_tasks'),
             path('export/users/', self.admin_view(self.export_users), name='export_users'),
             path('export/mahallas/', self.admin_view(self.export_mahallas), name='export_mahallas'),
+            path('export/jobs/<int:job_id>/download/', self.admin_view(self.export_download), name='export_download'),
+            path('api/exports/<int:job_id>/', self.admin_view(self.export_progress_api), name='export_progress_api'),
         ]
         return custom_urls + urls
 
@@ -49,72 +51,68 @@ class CustomAdminSite(admin.AdminSite):
     def dashboard_stats_api(self, request):
         days = int(request.GET.get('days', 30))
 
-        end_date = timezone.now()
+        end_date = timezone.now().date()
         start_date = end_date - timedelta(days=days)
 
-        tasks = Task.objects.filter(created_at__gte=start_date)
-        total_tasks = tasks.count()
+        stats = DailyMahallaStats.objects.filter(date__gte=start_date, date__lte=end_date)
+        sums = {
+            'total': Sum('total'),
+            'completed': Sum('completed'),
+            'active': Sum('active'),
+            'rejected': Sum('rejected'),
+        }
 
         mahalla_stats = []
-        for mahalla in Mahallah.objects.all():
-            mahalla_tasks = tasks.filter(mahallahs=mahalla)
-            total = mahalla_tasks.count()
+        mahalla_rows = stats.filter(mahallah__isnull=False).values(
+            'mahallah_id', 'mahallah__name', 'mahallah__district__name', 'mahallah__status'
+        ).annotate(**sums)
+
+        for row in mahalla_rows:
+            total = row['total'] or 0
             if total == 0:
                 continue
 
-            completed = mahalla_tasks.filter(status='completed').count()
-            active = mahalla_tasks.filter(status='active').count()
-            rejected = mahalla_tasks.filter(status='rejected').count()
-
+            completed = row['completed'] or 0
             completion_rate = (completed / total) * 100 if total > 0 else 0
 
             mahalla_stats.append({
-                'id': mahalla.id,
-                'name': mahalla.name,
-                'district': mahalla.district.name,
-                'status': mahalla.status,
+                'id': row['mahallah_id'],
+                'name': row['mahallah__name'],
+                'district': row['mahallah__district__name'],
+                'status': row['mahallah__status'],
                 'total': total,
                 'completed': completed,
-                'active': active,
-                'rejected': rejected,
+                'active': row['active'] or 0,
+                'rejected': row['rejected'] or 0,
                 'completion_rate': round(completion_rate, 1)
             })
 
         mahalla_stats.sort(key=lambda x: x['completion_rate'], reverse=True)
 
-        daily_stats = []
-        current_date = start_date.date()
-        end_date_date = end_date.date()
-
-        while current_date <= end_date_date:
-            next_date = current_date + timedelta(days=1)
+        day_rows = {row.date: row for row in stats.filter(mahallah__isnull=True)}
 
-            day_tasks = tasks.filter(
-                created_at__date__gte=current_date,
-                created_at__date__lt=next_date
-            )
+        daily_stats = []
+        current_date = start_date
 
-            total = day_tasks.count()
-            completed = day_tasks.filter(status='completed').count()
-            active = day_tasks.filter(status='active').count()
-            rejected = day_tasks.filter(status='rejected').count()
+        while current_date <= end_date:
+            row = day_rows.get(current_date)
 
             daily_stats.append({
                 'date': current_date.strftime('%Y-%m-%d'),
                 'date_display': current_date.strftime('%d/%m'),
-                'total': total,
-                'completed': completed,
-                'active': active,
-                'rejected': rejected
+                'total': row.total if row else 0,
+                'completed': row.completed if row else 0,
+                'active': row.active if row else 0,
+                'rejected': row.rejected if row else 0
             })
 
-            current_date = next_date
+            current_date += timedelta(days=1)
 
         return JsonResponse({
-            'total_tasks': total_tasks,
-            'completed_tasks': tasks.filter(status='completed').count(),
-            'active_tasks': tasks.filter(status='active').count(),
-            'rejected_tasks': tasks.filter(status='rejected').count(),
+            'total_tasks': sum(row['total'] for row in daily_stats),
+            'completed_tasks': sum(row['completed'] for row in daily_stats),
+            'active_tasks': sum(row['active'] for row in daily_stats),
+            'rejected_tasks': sum(row['rejected'] for row in daily_stats),
             'mahalla_stats': mahalla_stats,
             'daily_stats': daily_stats
         })
@@ -245,162 +243,55 @@ class CustomAdminSite(admin.AdminSite):
 
         return redirect('admin:broadcast')
 
-    def export_tasks(self, request):
-        response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        response['Content-Disposition'] = 'attachment; filename="topshiriqlar.xlsx"'
-
-        output = BytesIO()
-        workbook = xlsxwriter.Workbook(output)
-        worksheet = workbook.add_worksheet('Topshiriqlar')
-
-        header_format = workbook.add_format({
-            'bold': True,
-            'bg_color': '#3498db',
-            'color': 'white',
-            'border': 1
-        })
-
-        date_format = workbook.add_format({'num_format': 'dd/mm/yyyy hh:mm'})
+    def start_export(self, request, kind):
+        file_format = request.GET.get('format', 'xlsx')
+        if file_format not in dict(EXPORT_FORMAT_CHOICES):
+            file_format = 'xlsx'
 
-        headers = [
-            'ID', 'Sarlavha', 'Tavsif', 'Muddat', 'Holat',
-            'Yaratilgan sana', 'Mahallalar', 'Bajarilish %'
-        ]
-
-        for col, header in enumerate(headers):
-            worksheet.write(0, col, header, header_format)
-
-        tasks = Task.objects.all().order_by('-created_at')
-
-        for row, task in enumerate(tasks, start=1):
-            mahallas = ', '.join([m.name for m in task.mahallahs.all()])
-            completion_rate = task.get_completion_rate()
-
-            worksheet.write(row, 0, task.id)
-            worksheet.write(row, 1, task.title)
-            worksheet.write(row, 2, task.description)
-            if task.deadline:
-                worksheet.write_datetime(row, 3, task.deadline.replace(tzinfo=None), date_format)
-            else:
-                worksheet.write(row, 3, 'Belgilanmagan')
-            worksheet.write(row, 4, dict(TASK_STATUS_CHOICES).get(task.status))
-            worksheet.write_datetime(row, 5, task.created_at.replace(tzinfo=None), date_format)
-            worksheet.write(row, 6, mahallas)
-            worksheet.write(row, 7, f"{completion_rate:.1f}%")
+        job = ExportJob.objects.create(kind=kind, file_format=file_format, created_by=request.user)
 
-        worksheet.set_column(0, 0, 5)
-        worksheet.set_column(1, 1, 30)
-        worksheet.set_column(2, 2, 40)
-        worksheet.set_column(3, 5, 20)
-        worksheet.set_column(6, 6, 30)
-        worksheet.set_column(7, 7, 15)
+        if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+            return JsonResponse({
+                'success': True,
+                'job': self.export_job_data(job)
+            })
 
-        workbook.close()
-        output.seek(0)
+        messages.success(request, f'Eksport navbatga qo\'yildi (#{job.id}). Fayl tayyor bo\'lgach shu yerdan yuklab olishingiz mumkin')
+        return redirect('admin:api_exportjob_changelist')
+
+    def export_job_data(self, job):
+        return {
+            'id': job.id,
+            'kind': job.kind,
+            'format': job.file_format,
+            'status': job.status,
+            'progress': job.progress,
+            'processed_rows': job.processed_rows,
+            'total_rows': job.total_rows,
+            'error': job.error,
+            'progress_url': reverse('admin:export_progress_api', args=[job.id]),
+            'download_url': reverse('admin:export_download', args=[job.id]) if job.status == 'completed' else None,
+        }
 
-        response.write(output.read())
-        return response
+    def export_tasks(self, request):
+        return self.start_export(request, 'tasks')
 
     def export_users(self, request):
-        response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        response['Content-Disposition'] = 'attachment; filename="foydalanuvchilar.xlsx"'
-
-        output = BytesIO()
-        workbook = xlsxwriter.Workbook(output)
-        worksheet = workbook.add_worksheet('Foydalanuvchilar')
-
-        header_format = workbook.add_format({
-            'bold': True,
-            'bg_color': '#3498db',
-            'color': 'white',
-            'border': 1
-        })
-
-        headers = [
-            'ID', 'Foydalanuvchi nomi', 'To\'liq ism', 'Telefon', 'JSHIR',
-            'Telegram ID', 'Lavozim', 'Xodim turi', 'Mahalla', 'Tuman'
-        ]
-
-        for col, header in enumerate(headers):
-            worksheet.write(0, col, header, header_format)
-
-        users = User.objects.all().order_by('username')
-
-        for row, user in enumerate(users, start=1):
-            worksheet.write(row, 0, user.id)
-            worksheet.write(row, 1, user.username)
-            worksheet.write(row, 2, user.full_name)
-            worksheet.write(row, 3, user.phone)
-            worksheet.write(row, 4, user.jshir)
-            worksheet.write(row, 5, user.telegram_id if user.telegram_id else '')
-            worksheet.write(row, 6, user.job_title.name if user.job_title else '')
-            worksheet.write(row, 7, user.employee_type.name if user.employee_type else '')
-            worksheet.write(row, 8, user.mahallah.name if user.mahallah else '')
-            worksheet.write(row, 9, user.mahallah.district.name if user.mahallah else '')
-
-        worksheet.set_column(0, 0, 5)
-        worksheet.set_column(1, 2, 25)
-        worksheet.set_column(3, 4, 15)
-        worksheet.set_column(5, 5, 15)
-        worksheet.set_column(6, 9, 20)
-
-        workbook.close()
-        output.seek(0)
-
-        response.write(output.read())
-        return response
+        return self.start_export(request, 'users')
 
     def export_mahallas(self, request):
-        response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        response['Content-Disposition'] = 'attachment; filename="mahallalar.xlsx"'
-
-        output = BytesIO()
-        workbook = xlsxwriter.Workbook(output)
-        worksheet = workbook.add_worksheet('Mahallalar')
-
-        header_format = workbook.add_format({
-            'bold': True,
-            'bg_color': '#3498db',
-            'color': 'white',
-            'border': 1
-        })
-
-        headers = [
-            'ID', 'Nomi', 'Tuman', 'Viloyat', 'Holati',
-            'Topshiriqlar soni', 'Bajarilgan', 'Bajarilish %'
-        ]
-
-        for col, header in enumerate(headers):
-            worksheet.write(0, col, header, header_format)
-
-        mahallas = Mahallah.objects.all().order_by('district__region__name', 'district__name', 'name')
+        return self.start_export(request, 'mahallas')
 
-        for row, mahalla in enumerate(mahallas, start=1):
-            tasks = Task.objects.filter(mahallahs=mahalla)
-            total_tasks = tasks.count()
-            completed_tasks = tasks.filter(status='completed').count()
-            completion_rate = (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
+    def export_progress_api(self, request, job_id):
+        job = get_object_or_404(ExportJob, id=job_id)
+        return JsonResponse(self.export_job_data(job))
 
-            worksheet.write(row, 0, mahalla.id)
-            worksheet.write(row, 1, mahalla.name)
-            worksheet.write(row, 2, mahalla.district.name)
-            worksheet.write(row, 3, mahalla.district.region.name)
-            worksheet.write(row, 4, dict(MAHALLA_STATUS_CHOICES).get(mahalla.status))
-            worksheet.write(row, 5, total_tasks)
-            worksheet.write(row, 6, completed_tasks)
-            worksheet.write(row, 7, f"{completion_rate:.1f}%")
+    def export_download(self, request, job_id):
+        job = get_object_or_404(ExportJob, id=job_id, status='completed')
+        if not job.file:
+            raise Http404
 
-        worksheet.set_column(0, 0, 5)
-        worksheet.set_column(1, 3, 25)
-        worksheet.set_column(4, 4, 15)
-        worksheet.set_column(5, 6, 15)
-        worksheet.set_column(7, 7, 15)
-
-        workbook.close()
-        output.seek(0)
-
-        response.write(output.read())
-        return response
+        return FileResponse(job.file.open('rb'), as_attachment=True, filename=job.file.name.split('/')[-1])
 
 admin_site = CustomAdminSite(name='admin')
 
@@ -491,6 +382,7 @@ class CustomUserAdmin(UserAdmin):
 class TaskFileInline(admin.TabularInline):
     model = TaskFile
     extra = 1
+    readonly_fields = ('telegram_file_id',)
 
 @admin.register(TaskProgress, site=admin_site)
 class TaskProgressAdmin(admin.ModelAdmin):
@@ -519,6 +411,7 @@ class TaskAdmin(admin.ModelAdmin):
     search_fields = ('title', 'description')
     date_hierarchy = 'created_at'
     filter_horizontal = ('mahallahs',)
+    readonly_fields = ('total_mahallas', 'completed_mahallas')
     inlines = [TaskFileInline, TaskProgressInline, TaskStatusInline]
     actions = ['mark_as_completed', 'mark_as_rejected', 'mark_mahallas_green', 'mark_mahallas_yellow']
 
@@ -555,6 +448,44 @@ class TaskAdmin(admin.ModelAdmin):
     mark_mahallas_yellow.short_description = 'Mahallalarni sariq holatga o\'tkazish'
 
 
+@admin.register(DailyMahallaStats, site=admin_site)
+class DailyMahallaStatsAdmin(admin.ModelAdmin):
+    list_display = ('date', 'mahallah', 'total', 'completed', 'active', 'rejected')
+    list_filter = ('date', 'mahallah__district')
+    search_fields = ('mahallah__name',)
+    date_hierarchy = 'date'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ExportJob, site=admin_site)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'file_format', 'status', 'get_progress', 'created_by', 'created_at', 'finished_at', 'download_link')
+    list_filter = ('kind', 'status', 'created_at')
+    readonly_fields = ('kind', 'file_format', 'status', 'total_rows', 'processed_rows', 'file', 'error',
+                       'created_by', 'created_at', 'started_at', 'heartbeat_at', 'finished_at')
+
+    def get_progress(self, obj):
+        return f"{obj.progress:.1f}%"
+    get_progress.short_description = 'Jarayon'
+
+    def download_link(self, obj):
+        if obj.status != 'completed' or not obj.file:
+            return '-'
+        return format_html('<a href="{}">Yuklab olish</a>', reverse('admin:export_download', args=[obj.id]))
+    download_link.short_description = 'Fayl'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(BroadcastMessage, site=admin_site)
 class BroadcastMessageAdmin(admin.ModelAdmin):
     list_display = ('title', 'created_at', 'created_by', 'recipients_count', 'delivered_count', 'read_count')
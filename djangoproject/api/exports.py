@@ -0,0 +1,228 @@
+import csv
+import tempfile
+from datetime import datetime
+
+import xlsxwriter
+from django.core.files import File
+from django.db.models import Count, Q, Prefetch
+from django.utils import timezone
+
+from .models import Task, User, Mahallah, ExportJob, TASK_STATUS_CHOICES, MAHALLA_STATUS_CHOICES
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+def _local(value):
+    return timezone.localtime(value).replace(tzinfo=None) if value else None
+
+
+def task_rows():
+    statuses = dict(TASK_STATUS_CHOICES)
+    tasks = Task.objects.prefetch_related(
+        Prefetch('mahallahs', queryset=Mahallah.objects.only('id', 'name'))
+    ).order_by('-created_at')
+
+    for task in tasks.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield [
+            task.id,
+            task.title,
+            task.description,
+            _local(task.deadline) or 'Belgilanmagan',
+            statuses.get(task.status),
+            _local(task.created_at),
+            ', '.join(m.name for m in task.mahallahs.all()),
+            f"{task.get_completion_rate():.1f}%",
+        ]
+
+
+def user_rows():
+    users = User.objects.select_related(
+        'job_title', 'employee_type', 'mahallah__district'
+    ).order_by('username')
+
+    for user in users.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield [
+            user.id,
+            user.username,
+            user.full_name,
+            user.phone,
+            user.jshir,
+            user.telegram_id if user.telegram_id else '',
+            user.job_title.name if user.job_title else '',
+            user.employee_type.name if user.employee_type else '',
+            user.mahallah.name if user.mahallah else '',
+            user.mahallah.district.name if user.mahallah else '',
+        ]
+
+
+def mahalla_rows():
+    statuses = dict(MAHALLA_STATUS_CHOICES)
+    mahallas = Mahallah.objects.select_related('district__region').annotate(
+        total_tasks=Count('tasks'),
+        completed_tasks=Count('tasks', filter=Q(tasks__status='completed')),
+    ).order_by('district__region__name', 'district__name', 'name')
+
+    for mahalla in mahallas.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        total_tasks = mahalla.total_tasks
+        completed_tasks = mahalla.completed_tasks
+        completion_rate = (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
+
+        yield [
+            mahalla.id,
+            mahalla.name,
+            mahalla.district.name,
+            mahalla.district.region.name,
+            statuses.get(mahalla.status),
+            total_tasks,
+            completed_tasks,
+            f"{completion_rate:.1f}%",
+        ]
+
+
+EXPORTS = {
+    'tasks': {
+        'filename': 'topshiriqlar',
+        'sheet': 'Topshiriqlar',
+        'headers': [
+            'ID', 'Sarlavha', 'Tavsif', 'Muddat', 'Holat',
+            'Yaratilgan sana', 'Mahallalar', 'Bajarilish %'
+        ],
+        'columns': [(0, 0, 5), (1, 1, 30), (2, 2, 40), (3, 5, 20), (6, 6, 30), (7, 7, 15)],
+        'rows': task_rows,
+        'count': Task.objects.count,
+    },
+    'users': {
+        'filename': 'foydalanuvchilar',
+        'sheet': 'Foydalanuvchilar',
+        'headers': [
+            'ID', 'Foydalanuvchi nomi', 'To\'liq ism', 'Telefon', 'JSHIR',
+            'Telegram ID', 'Lavozim', 'Xodim turi', 'Mahalla', 'Tuman'
+        ],
+        'columns': [(0, 0, 5), (1, 2, 25), (3, 4, 15), (5, 5, 15), (6, 9, 20)],
+        'rows': user_rows,
+        'count': User.objects.count,
+    },
+    'mahallas': {
+        'filename': 'mahallalar',
+        'sheet': 'Mahallalar',
+        'headers': [
+            'ID', 'Nomi', 'Tuman', 'Viloyat', 'Holati',
+            'Topshiriqlar soni', 'Bajarilgan', 'Bajarilish %'
+        ],
+        'columns': [(0, 0, 5), (1, 3, 25), (4, 4, 15), (5, 6, 15), (7, 7, 15)],
+        'rows': mahalla_rows,
+        'count': Mahallah.objects.count,
+    },
+}
+
+
+def _tracked_rows(export, on_progress=None):
+    processed = 0
+    for values in export['rows']():
+        yield values
+        processed += 1
+        if on_progress and processed % EXPORT_CHUNK_SIZE == 0:
+            on_progress(processed)
+    if on_progress:
+        on_progress(processed)
+
+
+def write_xlsx(export, output, on_progress=None):
+    """Write an export to output row by row; constant_memory keeps only the current row in memory."""
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    worksheet = workbook.add_worksheet(export['sheet'])
+
+    header_format = workbook.add_format({
+        'bold': True,
+        'bg_color': '#3498db',
+        'color': 'white',
+        'border': 1
+    })
+    date_format = workbook.add_format({'num_format': 'dd/mm/yyyy hh:mm'})
+
+    for first_col, last_col, width in export['columns']:
+        worksheet.set_column(first_col, last_col, width)
+
+    for col, header in enumerate(export['headers']):
+        worksheet.write(0, col, header, header_format)
+
+    for row, values in enumerate(_tracked_rows(export, on_progress), start=1):
+        for col, value in enumerate(values):
+            if isinstance(value, datetime):
+                worksheet.write_datetime(row, col, value, date_format)
+            else:
+                worksheet.write(row, col, value)
+
+    workbook.close()
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def iter_csv(export, on_progress=None):
+    writer = csv.writer(Echo())
+    yield '\ufeff'
+    yield writer.writerow(export['headers'])
+    for values in _tracked_rows(export, on_progress):
+        yield writer.writerow([
+            value.strftime('%d/%m/%Y %H:%M') if isinstance(value, datetime) else value
+            for value in values
+        ])
+
+
+def write_csv(export, output, on_progress=None):
+    for chunk in iter_csv(export, on_progress):
+        output.write(chunk.encode('utf-8'))
+
+
+WRITERS = {
+    'xlsx': write_xlsx,
+    'csv': write_csv,
+}
+
+
+def run_export_job(job):
+    """Generate the file for a claimed ExportJob and store it under MEDIA_ROOT/exports/."""
+    export = EXPORTS[job.kind]
+    jobs = ExportJob.objects.filter(pk=job.pk)
+
+    def on_progress(processed):
+        # Doubles as the heartbeat that keeps ExportJob.fail_stale() off a live job
+        jobs.update(processed_rows=processed, heartbeat_at=timezone.now())
+
+    try:
+        job.total_rows = export['count']()
+        jobs.update(total_rows=job.total_rows)
+
+        with tempfile.TemporaryFile() as output:
+            WRITERS[job.file_format](export, output, on_progress)
+            output.seek(0)
+
+            timestamp = timezone.localtime().strftime('%Y%m%d_%H%M%S')
+            job.file.save(f'{export["filename"]}_{timestamp}.{job.file_format}', File(output), save=False)
+    except Exception as e:
+        job.status = 'failed'
+        job.error = str(e)
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'finished_at'])
+        raise
+
+    job.processed_rows = jobs.values_list('processed_rows', flat=True).get()
+    job.finished_at = timezone.now()
+    # Conditional, so a job fail_stale() has already given up on is not flipped back to completed
+    finished = jobs.filter(status='running').update(
+        status='completed',
+        file=job.file.name,
+        processed_rows=job.processed_rows,
+        total_rows=job.total_rows,
+        finished_at=job.finished_at
+    )
+    if not finished:
+        job.file.delete(save=False)
+        job.refresh_from_db()
+        return job
+
+    job.status = 'completed'
+    return job
@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import DailyMahallaStats
+
+
+class Command(BaseCommand):
+    help = 'Kunlik mahalla statistikasini topshiriqlar jadvalidan qayta hisoblaydi'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=None,
+            help='Faqat so\'nggi N kunni qayta hisoblash (standart: butun tarix)'
+        )
+
+    def handle(self, *args, **options):
+        start_date = None
+        if options['days'] is not None:
+            start_date = timezone.now().date() - timedelta(days=options['days'])
+
+        with transaction.atomic():
+            created = DailyMahallaStats.rebuild(start_date)
+
+        self.stdout.write(self.style.SUCCESS(f'{created} ta statistika qatori yaratildi'))
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.exports import run_export_job
+from api.models import ExportJob
+
+
+class Command(BaseCommand):
+    help = 'Navbatdagi eksport vazifalarini fon rejimida bajaradi va fayllarni MEDIA_ROOT/exports/ ga saqlaydi'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Navbatdagi barcha vazifalarni bajarib, chiqib ketish'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help='Navbat bo\'sh bo\'lganda tekshirish oralig\'i, soniyada (standart: 5)'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            job = ExportJob.claim_next()
+
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['interval'])
+                continue
+
+            self.stdout.write(f'#{job.id} {job.kind}.{job.file_format} boshlandi')
+            try:
+                run_export_job(job)
+            except Exception as e:
+                self.stderr.write(self.style.ERROR(f'#{job.id} xatolik: {e}'))
+            else:
+                if job.status != 'completed':
+                    self.stderr.write(self.style.WARNING(f'#{job.id} kechikib tugadi, vazifa allaqachon bekor qilingan'))
+                    continue
+                self.stdout.write(self.style.SUCCESS(f'#{job.id} tayyor: {job.file.name} ({job.processed_rows} qator)'))
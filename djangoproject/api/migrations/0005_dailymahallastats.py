@@ -0,0 +1,32 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_alter_taskfile_options_remove_taskfile_task_progress_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyMahallaStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Sana')),
+                ('total', models.IntegerField(default=0, verbose_name='Jami')),
+                ('completed', models.IntegerField(default=0, verbose_name='Bajarilgan')),
+                ('active', models.IntegerField(default=0, verbose_name='Faol')),
+                ('rejected', models.IntegerField(default=0, verbose_name='Rad etilgan')),
+                ('mahallah', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='api.mahallah', verbose_name='Mahalla')),
+            ],
+            options={
+                'verbose_name': 'Kunlik mahalla statistikasi',
+                'verbose_name_plural': 'Kunlik mahalla statistikasi',
+                'indexes': [models.Index(fields=['date'], name='api_dailyma_date_01091b_idx')],
+                'unique_together': {('mahallah', 'date')},
+            },
+        ),
+    ]
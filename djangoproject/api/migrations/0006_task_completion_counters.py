@@ -0,0 +1,44 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:13
+
+from django.db import migrations, models
+from django.db.models import Count, F
+
+
+def backfill_completion_counters(apps, schema_editor):
+    Task = apps.get_model('api', 'Task')
+    TaskStatus = apps.get_model('api', 'TaskStatus')
+
+    totals = dict(Task.objects.annotate(count=Count('mahallahs')).values_list('id', 'count'))
+    completed = dict(
+        TaskStatus.objects.filter(status='completed', user__mahallah__tasks=F('task'))
+        .values('task')
+        .annotate(count=Count('user__mahallah', distinct=True))
+        .values_list('task', 'count')
+    )
+
+    tasks = []
+    for task_id, total in totals.items():
+        tasks.append(Task(id=task_id, total_mahallas=total, completed_mahallas=completed.get(task_id, 0)))
+
+    Task.objects.bulk_update(tasks, ['total_mahallas', 'completed_mahallas'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_dailymahallastats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='completed_mahallas',
+            field=models.IntegerField(default=0, verbose_name='Bajargan mahallalar soni'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='total_mahallas',
+            field=models.IntegerField(default=0, verbose_name='Mahallalar soni'),
+        ),
+        migrations.RunPython(backfill_completion_counters, migrations.RunPython.noop),
+    ]
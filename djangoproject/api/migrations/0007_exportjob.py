@@ -0,0 +1,38 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_task_completion_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('tasks', 'Topshiriqlar'), ('users', 'Foydalanuvchilar'), ('mahallas', 'Mahallalar')], max_length=20, verbose_name='Turi')),
+                ('file_format', models.CharField(choices=[('xlsx', 'Excel'), ('csv', 'CSV')], default='xlsx', max_length=10, verbose_name='Format')),
+                ('status', models.CharField(choices=[('pending', 'Navbatda'), ('running', 'Jarayonda'), ('completed', 'Tayyor'), ('failed', 'Xatolik')], default='pending', max_length=20, verbose_name='Holat')),
+                ('total_rows', models.IntegerField(default=0, verbose_name='Jami qatorlar')),
+                ('processed_rows', models.IntegerField(default=0, verbose_name='Tayyor qatorlar')),
+                ('file', models.FileField(blank=True, upload_to='exports/', verbose_name='Fayl')),
+                ('error', models.TextField(blank=True, verbose_name='Xatolik')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Yaratilgan sana')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Boshlangan vaqt')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Tugagan vaqt')),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='export_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Yaratuvchi')),
+            ],
+            options={
+                'verbose_name': 'Eksport',
+                'verbose_name_plural': 'Eksportlar',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='api_exportj_status_b92980_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_exportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='broadcastmessage',
+            name='target_id',
+            field=models.IntegerField(blank=True, null=True, verbose_name='Tuman yoki mahalla ID'),
+        ),
+        migrations.AddField(
+            model_name='broadcastmessage',
+            name='target_type',
+            field=models.CharField(choices=[('all', 'Barcha foydalanuvchilar'), ('district', 'Tuman'), ('mahalla', 'Mahalla')], default='all', max_length=20, verbose_name='Qabul qiluvchilar'),
+        ),
+    ]
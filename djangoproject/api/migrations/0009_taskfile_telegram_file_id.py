@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_broadcastmessage_target'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskfile',
+            name='telegram_file_id',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_taskfile_telegram_file_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True, verbose_name='Kalit')),
+                ('status_code', models.PositiveSmallIntegerField(verbose_name='Javob kodi')),
+                ('response', models.JSONField(default=dict, verbose_name='Javob')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Yaratilgan sana')),
+            ],
+            options={
+                'verbose_name': "So'rov kaliti",
+                'verbose_name_plural': "So'rov kalitlari",
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:50
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def drop_duplicate_totals(apps, schema_editor):
+    # Concurrent refreshes could insert a day total twice; keep the newest row of each day
+    DailyMahallaStats = apps.get_model('api', 'DailyMahallaStats')
+    totals = DailyMahallaStats.objects.filter(mahallah__isnull=True)
+    keep = totals.values('date').annotate(keep_id=Max('id')).values_list('keep_id', flat=True)
+    totals.exclude(id__in=list(keep)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='dailymahallastats',
+            unique_together=set(),
+        ),
+        migrations.RunPython(drop_duplicate_totals, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='dailymahallastats',
+            constraint=models.UniqueConstraint(fields=('mahallah', 'date'), name='daily_stats_mahallah_date'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailymahallastats',
+            constraint=models.UniqueConstraint(condition=models.Q(('mahallah__isnull', True)), fields=('date',), name='daily_stats_total_date'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:52
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_heartbeat(apps, schema_editor):
+    # Jobs already stuck in running get their start time, so fail_stale() can clear them
+    ExportJob = apps.get_model('api', 'ExportJob')
+    ExportJob.objects.filter(status='running', heartbeat_at__isnull=True).update(heartbeat_at=F('started_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_daily_stats_total_constraint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Oxirgi faollik'),
+        ),
+        migrations.RunPython(backfill_heartbeat, migrations.RunPython.noop),
+    ]
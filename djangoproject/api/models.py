@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, Q, Sum, OuterRef, Subquery
+from django.db.models.functions import TruncDate, TruncMonth
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 from django.utils import timezone
 from datetime import datetime, timedelta
@@ -75,75 +77,72 @@ class Mahallah(models.Model):
         end_date = timezone.now().date()
         start_date = end_date - timedelta(days=days)
 
+        rows = {
+            row.date: row
+            for row in self.daily_stats.filter(date__gte=start_date, date__lte=end_date)
+        }
+
         stats = []
         current_date = start_date
 
         while current_date <= end_date:
-            next_date = current_date + timedelta(days=1)
-
-            tasks = Task.objects.filter(
-                mahallahs=self,
-                created_at__date__gte=current_date,
-                created_at__date__lt=next_date
-            )
-
-            total = tasks.count()
-            completed = tasks.filter(status='completed').count()
-            rejected = tasks.filter(status='rejected').count()
-            active = tasks.filter(status='active').count()
+            row = rows.get(current_date)
+            total = row.total if row else 0
+            completed = row.completed if row else 0
 
             stats.append({
                 'date': current_date,
                 'total': total,
                 'completed': completed,
-                'rejected': rejected,
-                'active': active,
+                'rejected': row.rejected if row else 0,
+                'active': row.active if row else 0,
                 'completion_rate': (completed / total * 100) if total > 0 else 0
             })
 
-            current_date = next_date
+            current_date += timedelta(days=1)
 
         return stats
 
 
     def get_monthly_stats(self, months=12):
-        end_date = timezone.now().date().replace(day=1)
-        stats = []
+        today = timezone.now().date()
+        first_day = today.replace(day=1)
 
+        month_starts = []
         for i in range(months):
-            if i > 0:
-                last_day = end_date.replace(day=1) - timedelta(days=1)
+            month_starts.append(first_day)
+            if first_day.month == 1:
+                first_day = first_day.replace(year=first_day.year-1, month=12)
             else:
-                last_day = timezone.now().date()
-
-            first_day = end_date.replace(day=1)
-
-            tasks = Task.objects.filter(
-                mahallahs=self,
-                created_at__date__gte=first_day,
-                created_at__date__lte=last_day
-            )
+                first_day = first_day.replace(month=first_day.month-1)
+
+        rows = self.daily_stats.filter(
+            date__gte=month_starts[-1],
+            date__lte=today
+        ).annotate(month=TruncMonth('date')).values('month').annotate(
+            total_sum=Sum('total'),
+            completed_sum=Sum('completed'),
+            rejected_sum=Sum('rejected'),
+            active_sum=Sum('active'),
+        )
+        totals = {row['month']: row for row in rows}
 
-            total = tasks.count()
-            completed = tasks.filter(status='completed').count()
-            rejected = tasks.filter(status='rejected').count()
-            active = tasks.filter(status='active').count()
+        stats = []
+        for first_day in month_starts:
+            row = totals.get(first_day, {})
+            total = row.get('total_sum') or 0
+            completed = row.get('completed_sum') or 0
 
             stats.append({
                 'month': first_day.strftime('%Y-%m'),
                 'month_name': first_day.strftime('%B %Y'),
                 'total': total,
                 'completed': completed,
-                'rejected': rejected,
-                'active': active,
+                'rejected': row.get('rejected_sum') or 0,
+                'active': row.get('active_sum') or 0,
                 'completion_rate': (completed / total * 100) if total > 0 else 0
             })
 
-            if first_day.month == 1:
-                end_date = end_date.replace(year=end_date.year-1, month=12)
-            else:
-                end_date = end_date.replace(month=end_date.month-1)
-
         return list(reversed(stats))
 
 class JobTitle(models.Model):
@@ -251,6 +250,19 @@ class DeviceSession(models.Model):
     def __str__(self):
         return f"{self.user} - {self.device_name}"
 
+class TaskQuerySet(models.QuerySet):
+    def with_status_info(self):
+        history = TaskStatus.objects.filter(task=OuterRef('pk')).order_by('-created_at', '-id')
+        completed = history.filter(status='completed')
+        rejected = history.filter(status='rejected')
+
+        return self.annotate(
+            latest_status=Subquery(history.values('status')[:1]),
+            last_completed_at=Subquery(completed.values('created_at')[:1]),
+            last_rejected_at=Subquery(rejected.values('created_at')[:1]),
+            last_rejection_reason=Subquery(rejected.values('rejection_reason')[:1]),
+        )
+
 class Task(models.Model):
     title = models.CharField('Sarlavha', max_length=255)
     description = models.TextField('Tavsif')
@@ -260,6 +272,10 @@ class Task(models.Model):
     status = models.CharField('Holat', max_length=20, choices=TASK_STATUS_CHOICES, default='active')
 
     mahallahs = models.ManyToManyField(Mahallah, related_name='tasks', verbose_name='Mahallalar')
+    total_mahallas = models.IntegerField('Mahallalar soni', default=0)
+    completed_mahallas = models.IntegerField('Bajargan mahallalar soni', default=0)
+
+    objects = TaskQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Topshiriq'
@@ -279,28 +295,44 @@ class Task(models.Model):
         return completed_status.created_at <= self.deadline
 
     def get_completion_rate(self):
-        mahalla_count = self.mahallahs.count()
-        if mahalla_count == 0:
+        if self.total_mahallas == 0:
             return 0
 
-        completed_count = 0
-        for mahalla in self.mahallahs.all():
-            users = User.objects.filter(mahallah=mahalla)
-            user_completed = TaskStatus.objects.filter(
-                task=self,
-                user__in=users,
-                status='completed'
-            ).exists()
-
-            if user_completed:
-                completed_count += 1
+        return (self.completed_mahallas / self.total_mahallas) * 100
+
+    def refresh_completion(self, save=True):
+        """
+        Recount assigned mahallas and those where a user has completed the task.
+
+        Signals call this whenever the inputs change through the ORM (statuses, assigned
+        mahallas, a user's mahalla, a deleted mahalla). Bulk queryset updates bypass
+        them; run it on the affected tasks afterwards to repair the counters.
+        """
+        # Only this task's completions are scanned, not every status of every user in the mahallas
+        completed_mahallah_ids = TaskStatus.objects.filter(
+            task=self,
+            status='completed',
+            user__mahallah__isnull=False
+        ).values('user__mahallah')
+        counts = self.mahallahs.aggregate(
+            total=Count('id'),
+            completed=Count('id', filter=Q(id__in=completed_mahallah_ids)),
+        )
+        self.total_mahallas = counts['total']
+        self.completed_mahallas = counts['completed']
 
-        return (completed_count / mahalla_count) * 100
+        if save:
+            Task.objects.filter(pk=self.pk).update(
+                total_mahallas=self.total_mahallas,
+                completed_mahallas=self.completed_mahallas
+            )
 
     @property
     def completion_percentage(self):
         return self.get_completion_rate()
 
+    # One transaction, so the rollup refreshes of the nested saves run once
+    @transaction.atomic
     def save(self, *args, **kwargs):
         is_new = self.pk is None
         super().save(*args, **kwargs)
@@ -325,6 +357,8 @@ class Task(models.Model):
                     mahalla.status = 'red'
                     mahalla.save()
 
+        DailyMahallaStats.refresh_for_task(self)
+
 
 
                     
@@ -384,6 +418,8 @@ class TaskFile(models.Model):
     file_name = models.CharField(max_length=255)
     file_type = models.CharField(max_length=50)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # Set by the bot after its first upload so the file can be resent without transferring it
+    telegram_file_id = models.CharField(max_length=255, blank=True, default='')
     
     def __str__(self):
         return self.file_name
@@ -406,11 +442,13 @@ class TaskStatus(models.Model):
     def __str__(self):
         return f"{self.task.title} - {self.status}"
 
+    @transaction.atomic
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
 
         self.task.status = self.status
-        self.task.save(update_fields=['status'])
+        self.task.refresh_completion(save=False)
+        self.task.save(update_fields=['status', 'total_mahallas', 'completed_mahallas'])
 
         if self.status == 'completed' and self.task.deadline and self.created_at <= self.task.deadline:
             mahalla = self.user.mahallah
@@ -418,12 +456,130 @@ class TaskStatus(models.Model):
                 mahalla.status = 'yellow'
                 mahalla.save()
 
+class DailyMahallaStats(models.Model):
+    mahallah = models.ForeignKey(
+        Mahallah,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='daily_stats',
+        verbose_name='Mahalla'
+    )
+    date = models.DateField('Sana')
+    total = models.IntegerField('Jami', default=0)
+    completed = models.IntegerField('Bajarilgan', default=0)
+    active = models.IntegerField('Faol', default=0)
+    rejected = models.IntegerField('Rad etilgan', default=0)
+
+    class Meta:
+        verbose_name = 'Kunlik mahalla statistikasi'
+        verbose_name_plural = 'Kunlik mahalla statistikasi'
+        constraints = [
+            models.UniqueConstraint(fields=['mahallah', 'date'], name='daily_stats_mahallah_date'),
+            # NULLs are distinct in a unique index, so the day totals need their own constraint
+            models.UniqueConstraint(fields=['date'], condition=Q(mahallah__isnull=True), name='daily_stats_total_date'),
+        ]
+        indexes = [models.Index(fields=['date'])]
+
+    def __str__(self):
+        return f"{self.mahallah or 'Jami'} - {self.date}"
+
+    @staticmethod
+    def status_counts():
+        return {
+            'total': Count('id', distinct=True),
+            'completed': Count('id', filter=Q(status='completed'), distinct=True),
+            'active': Count('id', filter=Q(status='active'), distinct=True),
+            'rejected': Count('id', filter=Q(status='rejected'), distinct=True),
+        }
+
+    @classmethod
+    def refresh(cls, date, mahallah_ids=()):
+        """Recompute the rollup rows of one day for the given mahallas and the day total."""
+        tasks = Task.objects.filter(created_at__date=date)
+        mahallah_ids = set(mahallah_ids)
+
+        counts = {None: tasks.aggregate(**cls.status_counts())}
+        if mahallah_ids:
+            rows = tasks.filter(mahallahs__in=mahallah_ids).values('mahallahs').annotate(**cls.status_counts())
+            for row in rows:
+                counts[row.pop('mahallahs')] = row
+
+        for mahallah_id in {None} | mahallah_ids:
+            values = counts.get(mahallah_id)
+            if not values or not values['total']:
+                cls.objects.filter(mahallah_id=mahallah_id, date=date).delete()
+                continue
+            cls.objects.update_or_create(mahallah_id=mahallah_id, date=date, defaults=values)
+
+    @classmethod
+    def refresh_for_task(cls, task, mahallah_ids=None):
+        if mahallah_ids is None:
+            mahallah_ids = task.mahallahs.values_list('id', flat=True)
+        cls.schedule_refresh(timezone.localdate(task.created_at), mahallah_ids)
+
+    @classmethod
+    def schedule_refresh(cls, date, mahallah_ids=()):
+        """
+        Refresh when the current transaction commits, or at once outside one. A status
+        change saves its task more than once, so calls within a transaction are merged:
+        each registers a commit callback, and the first one to run refreshes every
+        pending day and clears the marker, leaving nothing for the rest.
+        """
+        connection = transaction.get_connection()
+        pending = getattr(connection, 'daily_stats_pending', None)
+        if pending is None:
+            pending = connection.daily_stats_pending = {}
+        pending.setdefault(date, set()).update(mahallah_ids)
+        transaction.on_commit(lambda: cls._run_pending(connection))
+
+    @classmethod
+    def _run_pending(cls, connection):
+        # Days left by a rolled back transaction are refreshed too, which is harmless
+        pending, connection.daily_stats_pending = getattr(connection, 'daily_stats_pending', None), None
+        for date, mahallah_ids in (pending or {}).items():
+            cls.refresh(date, mahallah_ids)
+
+    @classmethod
+    def rebuild(cls, start_date=None):
+        """Rebuild the rollup from the task table, optionally only from start_date on."""
+        tasks = Task.objects.all()
+        rows = cls.objects.all()
+        if start_date:
+            tasks = tasks.filter(created_at__date__gte=start_date)
+            rows = rows.filter(date__gte=start_date)
+
+        tasks = tasks.annotate(day=TruncDate('created_at'))
+        grouped = list(tasks.values('day').annotate(**cls.status_counts()))
+        grouped += list(
+            tasks.filter(mahallahs__isnull=False).values('day', 'mahallahs').annotate(**cls.status_counts())
+        )
+
+        rows.delete()
+        return len(cls.objects.bulk_create([
+            cls(
+                mahallah_id=row.pop('mahallahs', None),
+                date=row.pop('day'),
+                **row
+            )
+            for row in grouped
+        ], batch_size=1000))
+
+BROADCAST_TARGET_CHOICES = [
+    ('all', 'Barcha foydalanuvchilar'),
+    ('district', 'Tuman'),
+    ('mahalla', 'Mahalla'),
+]
+
 class BroadcastMessage(models.Model):
     title = models.CharField('Sarlavha', max_length=255)
     message = models.TextField('Xabar matni')
     created_at = models.DateTimeField('Yuborilgan sana', auto_now_add=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='sent_broadcasts', verbose_name='Yuboruvchi')
 
+    target_type = models.CharField('Qabul qiluvchilar', max_length=20, choices=BROADCAST_TARGET_CHOICES, default='all')
+    target_id = models.IntegerField('Tuman yoki mahalla ID', null=True, blank=True)
+
     recipients_count = models.IntegerField('Qabul qiluvchilar soni', default=0)
     delivered_count = models.IntegerField('Yetkazilganlar soni', default=0)
     read_count = models.IntegerField('O\'qilganlar soni', default=0)
@@ -436,6 +592,112 @@ class BroadcastMessage(models.Model):
     def __str__(self):
         return self.title
 
+    @staticmethod
+    def target_users(target_type, target_id=None):
+        users = User.objects.filter(is_active=True, telegram_id__isnull=False)
+
+        if target_type == 'all':
+            return users
+        if target_type == 'district' and target_id:
+            return users.filter(mahallah__district_id=target_id)
+        if target_type == 'mahalla' and target_id:
+            return users.filter(mahallah_id=target_id)
+        return None
+
+    def recipients(self):
+        return self.target_users(self.target_type, self.target_id)
+
+EXPORT_KIND_CHOICES = [
+    ('tasks', 'Topshiriqlar'),
+    ('users', 'Foydalanuvchilar'),
+    ('mahallas', 'Mahallalar'),
+]
+
+EXPORT_FORMAT_CHOICES = [
+    ('xlsx', 'Excel'),
+    ('csv', 'CSV'),
+]
+
+EXPORT_STATUS_CHOICES = [
+    ('pending', 'Navbatda'),
+    ('running', 'Jarayonda'),
+    ('completed', 'Tayyor'),
+    ('failed', 'Xatolik'),
+]
+
+# A running job whose worker hasn't reported progress for this long is taken as abandoned
+EXPORT_STALE_AFTER = timedelta(minutes=10)
+
+class ExportJob(models.Model):
+    kind = models.CharField('Turi', max_length=20, choices=EXPORT_KIND_CHOICES)
+    file_format = models.CharField('Format', max_length=10, choices=EXPORT_FORMAT_CHOICES, default='xlsx')
+    status = models.CharField('Holat', max_length=20, choices=EXPORT_STATUS_CHOICES, default='pending')
+    total_rows = models.IntegerField('Jami qatorlar', default=0)
+    processed_rows = models.IntegerField('Tayyor qatorlar', default=0)
+    file = models.FileField('Fayl', upload_to='exports/', blank=True)
+    error = models.TextField('Xatolik', blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='export_jobs', verbose_name='Yaratuvchi')
+    created_at = models.DateTimeField('Yaratilgan sana', auto_now_add=True)
+    started_at = models.DateTimeField('Boshlangan vaqt', null=True, blank=True)
+    heartbeat_at = models.DateTimeField('Oxirgi faollik', null=True, blank=True)
+    finished_at = models.DateTimeField('Tugagan vaqt', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Eksport'
+        verbose_name_plural = 'Eksportlar'
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} ({self.get_file_format_display()}) - {self.get_status_display()}"
+
+    @property
+    def progress(self):
+        if self.status == 'completed':
+            return 100
+        if self.total_rows > 0:
+            return min(round(self.processed_rows / self.total_rows * 100, 1), 99.9)
+        return 0
+
+    @classmethod
+    def fail_stale(cls, stale_after=EXPORT_STALE_AFTER):
+        """Fail running jobs left behind by a worker that crashed or was restarted; returns how many."""
+        now = timezone.now()
+        return cls.objects.filter(status='running', heartbeat_at__lt=now - stale_after).update(
+            status='failed',
+            error="Eksport to'xtab qoldi: fon jarayoni qayta ishga tushdi. Eksportni qaytadan yarating.",
+            finished_at=now
+        )
+
+    @classmethod
+    def claim_next(cls):
+        """Mark the oldest pending job as running and return it; the conditional update keeps two workers off the same job."""
+        cls.fail_stale()
+        for job_id in cls.objects.filter(status='pending').order_by('created_at').values_list('id', flat=True)[:5]:
+            now = timezone.now()
+            claimed = cls.objects.filter(id=job_id, status='pending').update(
+                status='running',
+                started_at=now,
+                heartbeat_at=now
+            )
+            if claimed:
+                return cls.objects.get(id=job_id)
+        return None
+
+class IdempotencyKey(models.Model):
+    """A write the bot may send more than once (a replay after a timeout), and the answer it got."""
+    key = models.CharField('Kalit', max_length=64, unique=True)
+    status_code = models.PositiveSmallIntegerField('Javob kodi')
+    response = models.JSONField('Javob', default=dict)
+    created_at = models.DateTimeField('Yaratilgan sana', auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = "So'rov kaliti"
+        verbose_name_plural = "So'rov kalitlari"
+
+    def __str__(self):
+        return self.key
+
 class Broadcast(models.Model):
     TARGET_CHOICES = (
         ('all', 'All Users'),
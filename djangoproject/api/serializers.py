@@ -9,10 +9,10 @@ class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('id', 'full_name', 'phone', 'telegram_id', 'job_title', 'job_title_name',
-                  'mahallah', 'mahalla_name', 'tuman_name')
+                  'mahallah', 'mahalla_name', 'tuman_name', 'is_staff', 'is_active')
 
 class TaskSerializer(serializers.ModelSerializer):
-    status = serializers.CharField(read_only=True)
+    status = serializers.SerializerMethodField()
     completed_at = serializers.SerializerMethodField()
     rejected_at = serializers.SerializerMethodField()
     rejection_reason = serializers.SerializerMethodField()
@@ -22,15 +22,29 @@ class TaskSerializer(serializers.ModelSerializer):
         fields = ('id', 'title', 'description', 'deadline', 'status',
                   'created_at', 'updated_at', 'completed_at', 'rejected_at', 'rejection_reason')
 
+    # The list and detail views annotate these values with
+    # Task.objects.with_status_info(); the queries below are only a fallback.
+    def get_status(self, obj):
+        if hasattr(obj, 'latest_status'):
+            return obj.latest_status or obj.status
+        latest_status = obj.status_history.order_by('-created_at').first()
+        return latest_status.status if latest_status else obj.status
+
     def get_completed_at(self, obj):
+        if hasattr(obj, 'last_completed_at'):
+            return obj.last_completed_at
         completed_status = obj.status_history.filter(status='completed').order_by('-created_at').first()
         return completed_status.created_at if completed_status else None
 
     def get_rejected_at(self, obj):
+        if hasattr(obj, 'last_rejected_at'):
+            return obj.last_rejected_at
         rejected_status = obj.status_history.filter(status='rejected').order_by('-created_at').first()
         return rejected_status.created_at if rejected_status else None
 
     def get_rejection_reason(self, obj):
+        if hasattr(obj, 'last_rejection_reason'):
+            return obj.last_rejection_reason
         rejected_status = obj.status_history.filter(status='rejected').order_by('-created_at').first()
         return rejected_status.rejection_reason if rejected_status else None
 
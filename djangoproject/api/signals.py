@@ -1,10 +1,118 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
 from django.dispatch import receiver
-from api.models import Task
-from api.utils import send_task_notification
+from api.models import User, Task, TaskFile, TaskStatus, Mahallah, DailyMahallaStats, ExportJob
+from api.utils import send_task_notification, send_role_update
 
 @receiver(post_save, sender=Task)
 def task_post_save(sender, instance, created, **kwargs):
     if created:
         send_task_notification(instance)
 
+@receiver(m2m_changed, sender=Task.mahallahs.through)
+def task_mahallahs_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        if action in ('post_add', 'post_remove'):
+            for task in Task.objects.filter(pk__in=pk_set):
+                task.refresh_completion()
+                DailyMahallaStats.refresh_for_task(task, [instance.pk])
+        return
+
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        instance.refresh_completion()
+
+    if action == 'pre_clear':
+        instance._cleared_mahallah_ids = list(instance.mahallahs.values_list('id', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        DailyMahallaStats.refresh_for_task(instance, pk_set)
+    elif action == 'post_clear':
+        DailyMahallaStats.refresh_for_task(instance, getattr(instance, '_cleared_mahallah_ids', []))
+
+@receiver(pre_delete, sender=Task)
+def task_pre_delete(sender, instance, **kwargs):
+    instance._deleted_mahallah_ids = list(instance.mahallahs.values_list('id', flat=True))
+
+@receiver(post_delete, sender=Task)
+def task_post_delete(sender, instance, **kwargs):
+    DailyMahallaStats.refresh_for_task(instance, getattr(instance, '_deleted_mahallah_ids', []))
+
+@receiver(post_delete, sender=TaskStatus)
+def task_status_post_delete(sender, instance, **kwargs):
+    if instance.status != 'completed':
+        return
+
+    task = Task.objects.filter(pk=instance.task_id).first()
+    if task:
+        task.refresh_completion()
+
+@receiver(pre_delete, sender=Mahallah)
+def mahallah_pre_delete(sender, instance, **kwargs):
+    # The cascade removes the task links without firing m2m_changed
+    instance._task_ids = list(instance.tasks.values_list('id', flat=True))
+
+@receiver(post_delete, sender=Mahallah)
+def mahallah_post_delete(sender, instance, **kwargs):
+    for task in Task.objects.filter(pk__in=getattr(instance, '_task_ids', [])):
+        task.refresh_completion()
+
+@receiver(pre_save, sender=TaskFile)
+def task_file_pre_save(sender, instance, update_fields=None, **kwargs):
+    # A replaced file must be uploaded to Telegram again
+    if instance.pk is None or not instance.telegram_file_id:
+        return
+    if update_fields is not None and 'file' not in update_fields:
+        return
+    previous = TaskFile.objects.filter(pk=instance.pk).values_list('file', flat=True).first()
+    if previous != instance.file.name:
+        instance.telegram_file_id = ''
+
+@receiver(post_delete, sender=ExportJob)
+def export_job_post_delete(sender, instance, **kwargs):
+    if instance.file:
+        instance.file.delete(save=False)
+
+ROLE_FIELDS = ('is_staff', 'is_active', 'telegram_id')
+
+@receiver(pre_save, sender=User)
+def user_mahallah_pre_save(sender, instance, update_fields=None, **kwargs):
+    instance._previous_mahallah = None
+    if instance.pk is None or (update_fields is not None and 'mahallah' not in update_fields):
+        return
+    instance._previous_mahallah = User.objects.filter(pk=instance.pk).values('mahallah_id').first()
+
+@receiver(post_save, sender=User)
+def user_mahallah_post_save(sender, instance, created, **kwargs):
+    # Completions count for the user's current mahalla, so moving them changes the tasks they completed
+    previous = getattr(instance, '_previous_mahallah', None)
+    if created or previous is None or previous['mahallah_id'] == instance.mahallah_id:
+        return
+    tasks = Task.objects.filter(status_history__user=instance, status_history__status='completed').distinct()
+    for task in tasks:
+        task.refresh_completion()
+
+@receiver(pre_save, sender=User)
+def user_pre_save(sender, instance, update_fields=None, **kwargs):
+    instance._previous_role = None
+    if instance.pk is None or (update_fields is not None and not set(update_fields) & set(ROLE_FIELDS)):
+        return
+    instance._previous_role = User.objects.filter(pk=instance.pk).values(*ROLE_FIELDS).first()
+
+@receiver(post_save, sender=User)
+def user_post_save(sender, instance, created, **kwargs):
+    previous = instance._previous_role
+    is_admin = instance.is_staff and instance.is_active
+
+    if created:
+        if is_admin and instance.telegram_id:
+            transaction.on_commit(lambda: send_role_update(instance.telegram_id, True))
+        return
+
+    if previous is None or previous == {field: getattr(instance, field) for field in ROLE_FIELDS}:
+        return
+
+    if instance.telegram_id:
+        transaction.on_commit(lambda: send_role_update(instance.telegram_id, is_admin))
+
+    old_telegram_id = previous['telegram_id']
+    if old_telegram_id and old_telegram_id != instance.telegram_id:
+        transaction.on_commit(lambda: send_role_update(old_telegram_id, False))
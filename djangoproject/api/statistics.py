@@ -0,0 +1,132 @@
+from datetime import timedelta
+
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import User, Task, Mahallah, District, DailyMahallaStats
+
+
+def get_period_range(period, today=None):
+    today = today or timezone.now().date()
+
+    if period == 'daily':
+        return today, today
+
+    if period == 'monthly':
+        start_date = today.replace(day=1)
+        if today.month == 12:
+            end_date = today.replace(year=today.year + 1, month=1, day=1) - timedelta(days=1)
+        else:
+            end_date = today.replace(month=today.month + 1, day=1) - timedelta(days=1)
+        return start_date, end_date
+
+    return None, None
+
+
+def completion_rate(completed, total):
+    if total > 0:
+        return round((completed / total) * 100, 1)
+    return 0
+
+
+def _date_filter(field, start_date, end_date):
+    if start_date and end_date:
+        return Q(**{f'{field}__gte': start_date, f'{field}__lte': end_date})
+    return Q()
+
+
+def get_task_totals(start_date=None, end_date=None):
+    totals = DailyMahallaStats.objects.filter(
+        _date_filter('date', start_date, end_date),
+        mahallah__isnull=True
+    ).aggregate(
+        total=Sum('total'),
+        completed=Sum('completed'),
+        active=Sum('active'),
+        rejected=Sum('rejected'),
+    )
+    return {key: value or 0 for key, value in totals.items()}
+
+
+def get_mahalla_completion(start_date=None, end_date=None):
+    stats_filter = _date_filter('daily_stats__date', start_date, end_date)
+
+    rows = Mahallah.objects.order_by('id').values('id', 'name').annotate(
+        total=Sum('daily_stats__total', filter=stats_filter),
+        completed=Sum('daily_stats__completed', filter=stats_filter),
+    )
+
+    return [
+        {
+            'id': row['id'],
+            'name': row['name'],
+            'completion_rate': completion_rate(row['completed'] or 0, row['total'] or 0)
+        }
+        for row in rows
+    ]
+
+
+def get_district_completion(start_date=None, end_date=None):
+    stats_filter = _date_filter('mahallahs__daily_stats__date', start_date, end_date)
+
+    rows = District.objects.order_by('id').values('id', 'name').annotate(
+        total=Sum('mahallahs__daily_stats__total', filter=stats_filter),
+        completed=Sum('mahallahs__daily_stats__completed', filter=stats_filter),
+    )
+
+    return [
+        {
+            'id': row['id'],
+            'name': row['name'],
+            'completion_rate': completion_rate(row['completed'] or 0, row['total'] or 0)
+        }
+        for row in rows
+    ]
+
+
+def get_daily_completed(start_date, end_date):
+    rows = Task.objects.filter(
+        status='completed',
+        updated_at__date__gte=start_date,
+        updated_at__date__lte=end_date
+    ).annotate(day=TruncDate('updated_at')).values('day').annotate(count=Count('id'))
+
+    counts = {row['day']: row['count'] for row in rows}
+
+    daily_stats = []
+    current_date = start_date
+    while current_date <= end_date:
+        daily_stats.append({
+            'date': current_date.strftime('%d.%m.%Y'),
+            'completed_tasks': counts.get(current_date, 0)
+        })
+        current_date += timedelta(days=1)
+
+    return daily_stats
+
+
+def build_statistics(period):
+    start_date, end_date = get_period_range(period)
+
+    totals = get_task_totals(start_date, end_date)
+
+    top_mahallas = sorted(
+        get_mahalla_completion(start_date, end_date),
+        key=lambda x: x['completion_rate'],
+        reverse=True
+    )
+
+    data = {
+        'completed_tasks': totals['completed'],
+        'active_tasks': totals['active'],
+        'rejected_tasks': totals['rejected'],
+        'active_users': User.objects.filter(is_active=True).count(),
+        'top_mahallas': top_mahallas,
+        'district_stats': get_district_completion(start_date, end_date)
+    }
+
+    if period == 'monthly':
+        data['daily_stats'] = get_daily_completed(start_date, end_date)
+
+    return data
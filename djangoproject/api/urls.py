@@ -13,10 +13,14 @@ urlpatterns = [
     path('webhook/broadcast-status/', views.broadcast_status_webhook, name='broadcast_status_webhook'),
     path('statistics/<str:period>/', views.get_statistics, name='get_statistics'),
     path('broadcast/', views.broadcast_message, name='broadcast_message'),
+    path('broadcasts/<int:broadcast_id>/recipients/', views.broadcast_recipients, name='broadcast_recipients'),
     path('districts/', views.get_districts, name='get_districts'),
     path('mahallas/', views.get_mahallas, name='get_mahallas'),
     path('users/telegram-ids/', views.get_telegram_ids, name='get_telegram_ids'),
+    path('users/staff-ids/', views.get_staff_telegram_ids, name='get_staff_telegram_ids'),
     path('grade-task/', views.grade_task, name='grade_task'),
+    path('task-files/telegram-ids/', views.set_task_file_telegram_ids, name='set_task_file_telegram_ids'),
+    path('batch/', views.batch, name='batch'),
     path('', views.simple_page, name='simple_page'),  
 ]
 
@@ -1,6 +1,11 @@
 import requests
 import logging
+from datetime import timedelta
+from functools import wraps
 from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.response import Response
 
 logger = logging.getLogger(__name__)
 
@@ -41,3 +46,63 @@ def send_task_notification(task):
     except Exception as e:
         logger.exception(f"Error sending task notification: {e}")
 
+
+def send_role_update(telegram_id, is_staff):
+    """Tell the bot that a user's admin role changed so it can drop its cached value."""
+    try:
+        webhook_url = getattr(settings, 'TELEGRAM_BOT_WEBHOOK_URL', 'http://localhost:8080')
+        headers = {}
+        token = getattr(settings, 'TELEGRAM_BOT_WEBHOOK_TOKEN', None)
+        if token:
+            headers['X-Internal-Token'] = token
+
+        response = requests.post(
+            f"{webhook_url}/webhook/role-changed",
+            json={'telegram_id': telegram_id, 'is_staff': is_staff},
+            headers=headers,
+            timeout=5
+        )
+
+        if response.status_code != 200:
+            logger.error(f"Failed to send role update: {response.text}")
+    except Exception as e:
+        logger.warning(f"Error sending role update for {telegram_id}: {e}")
+
+
+IDEMPOTENCY_KEY_TTL = timedelta(days=7)
+
+
+def idempotent(view):
+    """
+    Run a write view at most once per Idempotency-Key header.
+
+    The bot replays writes whose answer it never got (a timeout, a dropped connection),
+    so the first try may already be stored. A successful answer is saved with the key in
+    the view's transaction, and any later request with that key gets it back without
+    running the view again. A concurrent duplicate fails on the unique key, its writes
+    are rolled back and it gets the stored answer too. Requests without the header run as usual.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return view(request, *args, **kwargs)
+
+        from api.models import IdempotencyKey
+        stored = IdempotencyKey.objects.filter(key=key).first()
+        if stored is None:
+            try:
+                with transaction.atomic():
+                    response = view(request, *args, **kwargs)
+                    if not 200 <= response.status_code < 300:
+                        return response
+                    IdempotencyKey.objects.create(key=key, status_code=response.status_code, response=response.data)
+                    IdempotencyKey.objects.filter(created_at__lt=timezone.now() - IDEMPOTENCY_KEY_TTL).delete()
+                    return response
+            except IntegrityError:
+                stored = IdempotencyKey.objects.filter(key=key).first()
+                if stored is None:
+                    raise
+
+        return Response(stored.response, status=stored.status_code)
+    return wrapper
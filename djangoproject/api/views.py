@@ -2,12 +2,21 @@ from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
+from django.http import HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
+from django.db import transaction
 from django.utils import timezone
 from .models import User, Task, TaskProgress, TaskFile, TaskStatus, Mahallah, BroadcastMessage, District
 from .serializers import UserSerializer, TaskSerializer, TaskDetailSerializer, MahallahSerializer, DistrictSerializer
-from django.db.models import Count, Q, Avg, F
+from .statistics import build_statistics
+from .utils import idempotent
+from django.db.models import Count, Q, Avg, F, Prefetch
 from datetime import timedelta
 import datetime
+import logging
+from urllib.parse import urlencode
+
+logger = logging.getLogger(__name__)
 
 @api_view(['GET'])
 def user_info(request):
@@ -50,12 +59,7 @@ def user_tasks(request):
     try:
         user = User.objects.get(telegram_id=telegram_id)
 
-        tasks = Task.objects.filter(mahallahs=user.mahallah)
-
-        for task in tasks:
-            latest_status = task.status_history.order_by('-created_at').first()
-            if latest_status:
-                task.status = latest_status.status
+        tasks = Task.objects.with_status_info().filter(mahallahs=user.mahallah)
 
         serializer = TaskSerializer(tasks, many=True)
         return Response({'tasks': serializer.data})
@@ -65,11 +69,7 @@ def user_tasks(request):
 @api_view(['GET'])
 def task_detail(request, task_id):
     try:
-        task = Task.objects.get(pk=task_id)
-
-        latest_status = task.status_history.order_by('-created_at').first()
-        if latest_status:
-            task.status = latest_status.status
+        task = Task.objects.with_status_info().get(pk=task_id)
 
         serializer = TaskDetailSerializer(task, context={'request': request})
         return Response({'task': serializer.data})
@@ -77,6 +77,7 @@ def task_detail(request, task_id):
         return Response({'message': 'Task not found'}, status=status.HTTP_404_NOT_FOUND)
 
 @api_view(['PATCH'])
+@idempotent
 def update_task_status(request, task_id):
     telegram_id = request.data.get('telegram_id')
     new_status = request.data.get('status')
@@ -95,15 +96,17 @@ def update_task_status(request, task_id):
         if user.mahallah not in task.mahallahs.all():
             return Response({'message': 'Task not assigned to your mahallah'}, status=status.HTTP_403_FORBIDDEN)
 
-        TaskStatus.objects.create(
-            task=task,
-            user=user,
-            status=new_status,
-            rejection_reason=rejection_reason if new_status == 'rejected' else None
-        )
+        # One transaction, so the two saves share a single rollup refresh
+        with transaction.atomic():
+            TaskStatus.objects.create(
+                task=task,
+                user=user,
+                status=new_status,
+                rejection_reason=rejection_reason if new_status == 'rejected' else None
+            )
 
-        task.status = new_status
-        task.save()
+            task.status = new_status
+            task.save()
 
         return Response({'message': 'Task status updated successfully'})
     except User.DoesNotExist:
@@ -112,6 +115,7 @@ def update_task_status(request, task_id):
         return Response({'message': 'Task not found'}, status=status.HTTP_404_NOT_FOUND)
 
 @api_view(['POST'])
+@idempotent
 def submit_task_progress(request):
     task_id = request.data.get('task_id')
     telegram_id = request.data.get('telegram_id')
@@ -227,22 +231,26 @@ def broadcast_webhook(request):
 @api_view(['POST'])
 def broadcast_status_webhook(request):
     broadcast_id = request.data.get('broadcast_id')
-    delivered_count = request.data.get('delivered_count', 0)
-    read_count = request.data.get('read_count', 0)
 
     if not broadcast_id:
         return Response({'message': 'Broadcast ID is required'}, status=status.HTTP_400_BAD_REQUEST)
 
-    try:
-        broadcast = BroadcastMessage.objects.get(pk=broadcast_id)
-        broadcast.delivered_count = delivered_count
-        broadcast.read_count = read_count
-        broadcast.save()
+    # The bot reports delivered_count in batches while a broadcast is running, so only
+    # the counters present in the payload are written.
+    updates = {
+        field: request.data[field]
+        for field in ('delivered_count', 'read_count')
+        if field in request.data
+    }
 
-        return Response({'message': 'Broadcast status updated successfully'})
-    except BroadcastMessage.DoesNotExist:
+    if not BroadcastMessage.objects.filter(pk=broadcast_id).exists():
         return Response({'message': 'Broadcast not found'}, status=status.HTTP_404_NOT_FOUND)
 
+    if updates:
+        BroadcastMessage.objects.filter(pk=broadcast_id).update(**updates)
+
+    return Response({'message': 'Broadcast status updated successfully'})
+
 @api_view(['POST'])
 def broadcast_message(request):
     title = request.data.get('title')
@@ -257,23 +265,9 @@ def broadcast_message(request):
             'message': 'Missing required fields'
         }, status=400)
     
-    target_users = []
-    
-    if target_type == 'all':
-        target_users = User.objects.filter(is_active=True, telegram_id__isnull=False)
-    elif target_type == 'district' and target_id:
-        target_users = User.objects.filter(
-            is_active=True,
-            telegram_id__isnull=False,
-            mahallah__district_id=target_id
-        )
-    elif target_type == 'mahalla' and target_id:
-        target_users = User.objects.filter(
-            is_active=True,
-            telegram_id__isnull=False,
-            mahallah_id=target_id
-        )
-    else:
+    target_users = BroadcastMessage.target_users(target_type, target_id)
+
+    if target_users is None:
         return Response({
             'success': False,
             'message': 'Invalid target type or missing target ID'
@@ -290,118 +284,26 @@ def broadcast_message(request):
         title=title,
         message=message,
         created_by=admin_user,
-        recipients_count=len(target_users)
+        target_type=target_type,
+        target_id=target_id if target_type != 'all' else None,
+        recipients_count=target_users.count()
     )
     
-    telegram_ids = []
-    for user in target_users:
-        if user.telegram_id:
-            telegram_ids.append(user.telegram_id)
-    
+    # Recipients are fetched page by page from broadcast_recipients
     return Response({
         'success': True,
         'broadcast_id': broadcast.id,
-        'sent_count': len(telegram_ids),
-        'telegram_ids': telegram_ids
+        'sent_count': broadcast.recipients_count
     })
 
 @api_view(['GET'])
-def get_statistics(request, period):
-    today = timezone.now().date()
-
-    if period == 'daily':
-        start_date = today
-        end_date = today
-    elif period == 'monthly':
-        start_date = today.replace(day=1)
-        if today.month == 12:
-            end_date = today.replace(year=today.year + 1, month=1, day=1) - timedelta(days=1)
-        else:
-            end_date = today.replace(month=today.month + 1, day=1) - timedelta(days=1)
-    else:
-        start_date = None
-        end_date = None
-
-    task_filters = {}
-    if start_date and end_date:
-        task_filters['created_at__date__gte'] = start_date
-        task_filters['created_at__date__lte'] = end_date
-
-    completed_tasks = Task.objects.filter(status='completed', **task_filters).count()
-    active_tasks = Task.objects.filter(status='active', **task_filters).count()
-    rejected_tasks = Task.objects.filter(status='rejected', **task_filters).count()
-
-    active_users = User.objects.filter(is_active=True).count()
-
-    mahallas = Mahallah.objects.all()
-    top_mahallas = []
-
-    for mahalla in mahallas:
-        mahalla_tasks = Task.objects.filter(mahallahs=mahalla, **task_filters)
-        total_tasks = mahalla_tasks.count()
-        completed_mahalla_tasks = mahalla_tasks.filter(status='completed').count()
+def broadcast_recipients(request, broadcast_id):
+    broadcast = get_object_or_404(BroadcastMessage, pk=broadcast_id)
+    return telegram_ids_page(request, broadcast.recipients())
 
-        if total_tasks > 0:
-            completion_rate = (completed_mahalla_tasks / total_tasks) * 100
-        else:
-            completion_rate = 0
-
-        top_mahallas.append({
-            'id': mahalla.id,
-            'name': mahalla.name,
-            'completion_rate': round(completion_rate, 1)
-        })
-
-    top_mahallas = sorted(top_mahallas, key=lambda x: x['completion_rate'], reverse=True)
-
-    districts = District.objects.all()
-    district_stats = []
-
-    for district in districts:
-        district_tasks = Task.objects.filter(mahallahs__district=district, **task_filters)
-        total_tasks = district_tasks.count()
-        completed_district_tasks = district_tasks.filter(status='completed').count()
-
-        if total_tasks > 0:
-            completion_rate = (completed_district_tasks / total_tasks) * 100
-        else:
-            completion_rate = 0
-
-        district_stats.append({
-            'id': district.id,
-            'name': district.name,
-            'completion_rate': round(completion_rate, 1)
-        })
-
-    data = {
-        'completed_tasks': completed_tasks,
-        'active_tasks': active_tasks,
-        'rejected_tasks': rejected_tasks,
-        'active_users': active_users,
-        'top_mahallas': top_mahallas,
-        'district_stats': district_stats
-    }
-
-    if period == 'monthly':
-        daily_stats = []
-        current_date = start_date
-
-        while current_date <= end_date:
-            day_completed = Task.objects.filter(
-                status='completed',
-                updated_at__date=current_date
-            ).count()
-
-            daily_stats.append({
-                'date': current_date.strftime('%d.%m.%Y'),
-                'completed_tasks': day_completed
-            })
-
-            current_date += timedelta(days=1)
-
-        data['daily_stats'] = daily_stats
-
-    return Response(data)
+@api_view(['GET'])
+def get_statistics(request, period):
+    return Response(build_statistics(period))
 
 @api_view(['GET'])
 def get_districts(request):
@@ -415,10 +317,50 @@ def get_mahallas(request):
     serializer = MahallahSerializer(mahallas, many=True)
     return Response(serializer.data)
 
+RECIPIENTS_PAGE_SIZE = 1000
+RECIPIENTS_MAX_PAGE_SIZE = 5000
+
+def telegram_ids_page(request, users):
+    """One keyset page of telegram ids; pass next_cursor back as ?cursor= for the following page."""
+    cursor = request.GET.get('cursor')
+
+    try:
+        limit = int(request.GET.get('limit', RECIPIENTS_PAGE_SIZE))
+        cursor = int(cursor) if cursor else None
+    except ValueError:
+        return Response({
+            'success': False,
+            'message': 'Invalid cursor or limit'
+        }, status=400)
+
+    limit = max(1, min(limit, RECIPIENTS_MAX_PAGE_SIZE))
+
+    if cursor is not None:
+        users = users.filter(telegram_id__gt=cursor)
+
+    telegram_ids = list(
+        users.order_by('telegram_id').values_list('telegram_id', flat=True)[:limit + 1]
+    )
+    has_more = len(telegram_ids) > limit
+    telegram_ids = telegram_ids[:limit]
+
+    return Response({
+        'success': True,
+        'telegram_ids': telegram_ids,
+        'next_cursor': telegram_ids[-1] if has_more else None
+    })
+
 @api_view(['GET'])
 def get_telegram_ids(request):
-    users = User.objects.filter(telegram_id__isnull=False)
-    telegram_ids = users.values_list('telegram_id', flat=True)
+    return telegram_ids_page(request, User.objects.filter(telegram_id__isnull=False))
+
+@api_view(['GET'])
+def get_staff_telegram_ids(request):
+    telegram_ids = User.objects.filter(
+        is_staff=True,
+        is_active=True,
+        telegram_id__isnull=False
+    ).values_list('telegram_id', flat=True)
     return Response({'telegram_ids': list(telegram_ids)})
 
 @api_view(['POST'])
@@ -515,7 +457,8 @@ def get_task_detail(request, task_id):
             'url': request.build_absolute_uri(file.file.url) if file.file else None,
             'file_type': file.file_type,
             'uploaded_at': file.uploaded_at.strftime('%d.%m.%Y %H:%M'),
-            'uploaded_by': 'Unknown'  # Since we don't have user info in TaskFile
+            'uploaded_by': 'Unknown',  # Since we don't have user info in TaskFile
+            'telegram_file_id': file.telegram_file_id or None
         })
     
     mahallas = []
@@ -542,7 +485,7 @@ def get_task_detail(request, task_id):
             'created_at': progress.created_at.strftime('%d.%m.%Y %H:%M')
         })
     
-    latest_status = task.status_history.order_by('-created_at').first()
+    latest_status = task.status_history.select_related('user').order_by('-created_at').first()
     status_info = None
     if latest_status:
         status_info = {
@@ -577,14 +520,30 @@ def get_task_detail(request, task_id):
         'task': task_data
     })
 
+TASKS_PAGE_SIZE = 20
+TASKS_MAX_PAGE_SIZE = 100
+
 @api_view(['GET'])
 def get_tasks(request):
-    from api.models import Task, User
+    if request.GET.get('telegram_id'):
+        return user_tasks(request._request)
     
     user_id = request.GET.get('user_id')
     mahalla_id = request.GET.get('mahalla_id')
     district_id = request.GET.get('district_id')
     status = request.GET.get('status')
+    cursor = request.GET.get('cursor')
+
+    try:
+        limit = int(request.GET.get('limit', TASKS_PAGE_SIZE))
+        cursor = int(cursor) if cursor else None
+    except ValueError:
+        return Response({
+            'success': False,
+            'message': 'Invalid cursor or limit'
+        }, status=400)
+
+    limit = max(1, min(limit, TASKS_MAX_PAGE_SIZE))
     
     tasks_query = Task.objects.all()
     
@@ -606,35 +565,120 @@ def get_tasks(request):
     
     if status:
         tasks_query = tasks_query.filter(status=status)
+
+    if cursor:
+        tasks_query = tasks_query.filter(id__lt=cursor)
+
+    # Filter through a subquery so the mahalla joins above neither duplicate
+    # rows nor inflate files_count.
+    page = list(
+        Task.objects.filter(id__in=tasks_query.values('id'))
+        .annotate(files_count=Count('files'))
+        .prefetch_related(Prefetch('mahallahs', queryset=Mahallah.objects.only('id', 'name')))
+        .order_by('-id')[:limit + 1]
+    )
+
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = page[-1].id
     
     tasks = []
-    for task in tasks_query.distinct():
-        # Use TaskFile model to count files
-        files_count = TaskFile.objects.filter(task=task).count()
-        
-        mahallas = []
-        for mahalla in task.mahallahs.all():
-            mahallas.append({
-                'id': mahalla.id,
-                'name': mahalla.name
-            })
-        
+    for task in page:
         tasks.append({
             'id': task.id,
             'title': task.title,
             'status': task.status,
-            'completion_percentage': task.completion_percentage if hasattr(task, 'completion_percentage') else 0,
+            'completion_percentage': task.completion_percentage,
             'deadline': task.deadline.strftime('%d.%m.%Y') if task.deadline else None,
             'created_at': task.created_at.strftime('%d.%m.%Y'),
-            'files_count': files_count,
-            'mahallas': mahallas
+            'files_count': task.files_count,
+            'mahallas': [{'id': mahalla.id, 'name': mahalla.name} for mahalla in task.mahallahs.all()]
         })
     
     return Response({
         'success': True,
-        'tasks': tasks
+        'tasks': tasks,
+        'next_cursor': next_cursor
     })
 
+@api_view(['POST'])
+def set_task_file_telegram_ids(request):
+    """Store the Telegram file_ids the bot got back when uploading task files: {"files": {"<id>": "<file_id>"}}."""
+    files = request.data.get('files')
+    if not isinstance(files, dict) or not files:
+        return Response({'message': 'files must be a non-empty object'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        file_ids = {int(pk): str(file_id) for pk, file_id in files.items() if file_id}
+    except (TypeError, ValueError):
+        return Response({'message': 'Invalid file id'}, status=status.HTTP_400_BAD_REQUEST)
+
+    task_files = list(TaskFile.objects.filter(pk__in=file_ids))
+    for task_file in task_files:
+        task_file.telegram_file_id = file_ids[task_file.pk]
+    TaskFile.objects.bulk_update(task_files, ['telegram_file_id'])
+
+    return Response({'success': True, 'updated': len(task_files)})
+
+BATCH_MAX_REQUESTS = 20
+
+def _batch_sub_request(request, path, params):
+    """Run one GET sub-request of a batch through the API's own URLconf and views."""
+    path = '/' + str(path).split('?', 1)[0].lstrip('/')
+    try:
+        match = resolve(path, urlconf='api.urls')
+    except Resolver404:
+        return {'status': 404, 'data': {'message': 'Not found'}}
+
+    view_class = getattr(match.func, 'cls', None)
+    if view_class is None or 'get' not in view_class.http_method_names:
+        return {'status': 405, 'data': {'message': 'Only GET requests can be batched'}}
+
+    query = urlencode(params or {}, doseq=True)
+    sub = HttpRequest()
+    sub.method = 'GET'
+    sub.path = sub.path_info = path
+    sub.META = {**request.META, 'REQUEST_METHOD': 'GET', 'QUERY_STRING': query}
+    sub.GET = QueryDict(query)
+    if hasattr(request._request, 'user'):
+        sub.user = request._request.user
+
+    try:
+        response = match.func(sub, *match.args, **match.kwargs)
+    except Exception:
+        # One broken sub-request must not fail the others
+        logger.exception(f"Batched request to {path} failed")
+        return {'status': 500, 'data': {'message': 'Internal server error'}}
+    return {'status': response.status_code, 'data': getattr(response, 'data', None)}
+
+@api_view(['POST'])
+def batch(request):
+    """
+    Run several read-only API calls in one round trip.
+
+    Body: {"requests": {"<name>": {"path": "tasks/5/", "params": {...}}, ...}}
+    Response: {"responses": {"<name>": {"status": 200, "data": {...}}, ...}}
+    Each sub-request is answered by the same view as a direct GET, errors included.
+    """
+    requests = request.data.get('requests')
+    if not isinstance(requests, dict) or not requests:
+        return Response({'message': 'requests must be a non-empty object'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(requests) > BATCH_MAX_REQUESTS:
+        return Response(
+            {'message': f'At most {BATCH_MAX_REQUESTS} requests can be batched'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    responses = {}
+    for name, sub_request in requests.items():
+        if not isinstance(sub_request, dict) or not sub_request.get('path'):
+            responses[name] = {'status': 400, 'data': {'message': 'path is required'}}
+            continue
+        responses[name] = _batch_sub_request(request, sub_request['path'], sub_request.get('params'))
+
+    return Response({'responses': responses})
+
 
 def simple_page(request):
     response_text = """
@@ -108,4 +108,5 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'api.User'
 
 TELEGRAM_BOT_WEBHOOK_URL = os.environ.get('TELEGRAM_BOT_WEBHOOK_URL', 'http://localhost:8080')
+TELEGRAM_BOT_WEBHOOK_TOKEN = os.environ.get('TELEGRAM_BOT_WEBHOOK_TOKEN')
 